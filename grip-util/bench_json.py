@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+"""bench_json.py measures the speed of the GripMeasurement JSON serializer
+
+Builds a synthetic set of measurements, shaped like the output of
+jira_access.py (a few names, one account, a few dozen projects), and times
+the generic serialization (json.dumps of each namedtuple's dict) against
+grip_import's MeasurementEncoder.  The two outputs are compared to confirm
+that they're byte-for-byte identical.
+
+USAGE:  bench_json.py [measurement_count] [repeats]
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import sys
+import json
+import random
+import time
+
+from grip_import import ERR_LABEL
+from grip_import import GripMeasurement
+from grip_import import MeasurementEncoder
+
+
+NAMES = ["measurement.defects_added"
+         ,"measurement.defects_closed"
+         ,"measurement.defects"
+         ,"measurement.requirements_added"
+         ,"measurement.requirements_closed"
+         ,"measurement.requirements"
+         ,"measurement.sprints_closed"
+         ]
+
+
+def make_measurements(count, projects=30, seed=1):
+    """Builds count synthetic measurements, each with its own metadata dict
+
+    Args:
+        count - number of measurements to build
+        projects - number of distinct projects in the metadata
+        seed - random seed, so runs are repeatable
+
+    Returns:
+        List of GripMeasurement namedtuples
+    """
+    rnd = random.Random(seed)
+    measurements = []
+    for i in range(count):
+        name = rnd.choice(NAMES)
+        value = 1.0 if name.endswith(("_added", "_closed")) else float(i)
+        measurements.append(GripMeasurement(
+            name=name
+            ,value=value
+            ,account="sample_acct"
+            ,timestamp=1420070400000 + rnd.randrange(10**10)
+            ,metadata={"project":"PROJ{0}".format(rnd.randrange(projects))}
+            ))
+    return measurements
+
+
+def time_encoder(encode, measurements, repeats):
+    """Returns the best time, in seconds, to encode all measurements, along
+    with the encoded strings from the last repeat"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encoded = [encode(m) for m in measurements]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, encoded
+
+
+def bench_main(count, repeats):
+    """Runs the benchmark and prints the results
+
+    Args:
+        count - number of measurements to encode
+        repeats - number of timed repetitions; the best time is reported
+
+    Returns:
+        True if the encoders produced identical output, False otherwise
+    """
+    measurements = make_measurements(count)
+    generic = json.JSONEncoder().encode
+    generic_time, generic_out = time_encoder(lambda m: generic(m._asdict())
+                                             ,measurements
+                                             ,repeats)
+    fast_time, fast_out = time_encoder(MeasurementEncoder().encode
+                                       ,measurements
+                                       ,repeats)
+    identical = (generic_out == fast_out)
+    fstr = ("\nMeasurements:        {0}\n"
+            "json.dumps(_asdict): {1:.3f}s ({2:.0f}/sec)\n"
+            "MeasurementEncoder:  {3:.3f}s ({4:.0f}/sec)\n"
+            "Speedup:             {5:.2f}x\n"
+            "Identical output:    {6}\n")
+    print(fstr.format(count
+                      ,generic_time, count / generic_time
+                      ,fast_time, count / fast_time
+                      ,generic_time / fast_time
+                      ,identical))
+    return identical
+
+
+if __name__ == '__main__':
+    try:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+        repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    except ValueError:
+        print("\nUSAGE:  {0} [measurement_count] [repeats]\n"
+              .format(__file__))
+        sys.exit(2)
+    if not bench_main(count, repeats):
+        print("{0}Serializer output differs from json.dumps".format(ERR_LABEL))
+        sys.exit(1)
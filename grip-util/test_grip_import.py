@@ -0,0 +1,61 @@
+"""Tests for grip_import.py
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import json
+import unittest
+
+from grip_import import MeasurementBatch
+
+
+class MeasurementBatchTest(unittest.TestCase):
+    def test_unhashable_metadata(self):
+        batch = MeasurementBatch()
+        batch.add("defects", {"tags":["a", "b"]}, 1.0, 10, "acct")
+        batch.add("defects", {"tags":["a", "b"]}, 2.0, 20, "acct")
+        batch.add("stories", {"repo":"x"}, 3.0, 30, "acct")
+        self.assertEqual(len(batch), 3)
+        self.assertEqual([m.metadata for m in batch]
+                         ,[{"tags":["a", "b"]}
+                           ,{"tags":["a", "b"]}
+                           ,{"repo":"x"}])
+        # equal unhashable metadata is stored once
+        self.assertIs(batch[0].metadata, batch[1].metadata)
+
+    def test_failed_add_leaves_columns_aligned(self):
+        batch = MeasurementBatch()
+        batch.add("defects", {"repo":"x"}, 1.0, 10, "acct")
+        with self.assertRaises(TypeError):
+            batch.add("defects", {"repo":"x"}, 2.0, "not a timestamp", "acct")
+        with self.assertRaises(TypeError):
+            batch.add("defects", {"repo":[object()]}, 3.0, 30, "acct")
+        batch.add("stories", {"repo":"y"}, 4.0, 40, "acct")
+        self.assertEqual(len(batch), 2)
+        self.assertEqual([(m.name, m.value, m.timestamp) for m in batch]
+                         ,[("defects", 1.0, 10), ("stories", 4.0, 40)])
+        self.assertEqual([json.loads(s)["name"] for s in batch.iter_json()]
+                         ,["defects", "stories"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,26 +7,62 @@ scripts.
 Module External Functions:
     make_measurement - factory method to produce the GripMeasurement namedtuple,
                        with appropriate defaults
+    intern_metadata - return the one shared, immutable Metadata object for
+                      a metadata value
+
     usage_message - prints out a standard usage message for import modules
     
     get_basename_arg - checks the argument list and extracts the root name given
 
     gen_timestamp - produce a timestamp given an ISO date string
 
+    gen_timestamps - produce the timestamps for a list of ISO date strings
+
     get_rest - request data for the given URL
 
+    get_rest_many - request data for a list of URLs with a bounded pool of
+                    concurrent workers
+
+    get_rest_stream - request data for the given URL, parsing the response
+                      incrementally as it downloads
+
+    get_transport - return the shared HTTP transport used by get_rest, which
+                    can record its responses to a cassette, or replay them
+
+    configure_transport - (re)build the shared HTTP transport from the
+                          configuration object
+
     get_requirement_cnt - scan the given text for requirements and return the
                           number of requirements discovered
 
+    get_requirement_cnts - count the requirements in many descriptions with
+                           a single scan
+
     load_config - loads the configuration file and converts the information
                   into a format appropriate for the configuration object
 
     gen_json - convert a list of GripMeasurement namedtuple's into a JSON
                string
 
+    write_json - stream GripMeasurement namedtuple's to a file as a JSON
+                 array
+
+    write_json_lines - stream GripMeasurement namedtuple's to a file as
+                       JSON Lines (one measurement per line)
+
 Module Classes:
     GripConfig - Class containing information extracted from the configuration
                  file
+    Metadata - Immutable measurement metadata, shared through intern_metadata
+    MeasurementEncoder - Fast JSON serializer for GripMeasurement namedtuples
+    MeasurementBatch - Columnar collection of measurements, with interned
+                       names, accounts and metadata
+    BlockCompressWriter - Text file-like object that gzip / xz compresses its
+                          output in independent blocks, on a thread pool
+    JsonArrayStream - Incremental parser yielding the elements of a large
+                      array in a streamed JSON object
+    GripTransport - Pooled, keep-alive HTTP transport shared by every REST
+                    request made during a run
 
 Module Globals:
     GLOBALS - Dictionary of global values to be shared by all import modules
@@ -55,31 +91,56 @@ __license__ = "Apache License, Version 2.0"
 __status__ = "Prototype"
 __version__ = "0.01"
 
+import codecs
 import json
+import gzip
+import lzma
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import isodate
 import configparser
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import textwrap
 import re
+from array import array
+from collections import deque
 from collections import namedtuple
 from collections import OrderedDict
+from bisect import bisect_right
+from functools import lru_cache
 from operator import itemgetter
 
 from qz_utils import openfile
+from qz_utils import Cassette
+from qz_utils import ResponseCache
+
+try:
+    # Only used to speed up MeasurementBatch.sort
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # Structures for different measurements
 GLOBALS = {'TIMESTAMP':0.0
            ,'ACCOUNT_NAME':None
            ,'VERBOSE':False
+           ,'JSON_FORMAT':"array"
+           ,'JSON_COMPRESSION':"none"
+           ,'COMPRESSION_THREADS':1
            }
 
 
 ERR_LABEL = "ERROR:  "
 NOTE_LABEL = "NOTE:  "
 
+# Write buffer size for measurement output files
+JSON_BUFFER_SIZE = 1024*1024
+
 # Represents a measurement as an immutable Python data structure that can be
 # efficiently converted to JSON for output
 GripMeasurement = namedtuple('GripMeasurement'
@@ -115,6 +176,64 @@ def make_measurement(name
                            ,metadata=metadata)
 
 
+class Metadata(dict):
+    """Immutable measurement metadata
+
+    A dict subclass, so that it serializes like any other metadata, whose
+    mutating methods raise TypeError.  Instances should be obtained from
+    intern_metadata, which returns one canonical object per distinct value,
+    so that every measurement with the same metadata shares it.
+    """
+    __slots__ = ()
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Metadata objects are immutable")
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    __ior__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+    def __hash__(self):
+        return hash(tuple(self.items()))
+    def __reduce__(self):
+        # unpickled copies are interned in the receiving process
+        return (intern_metadata, (dict(self),))
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+
+
+# Registry of canonical Metadata objects, keyed by their items
+_METADATA = {}
+_METADATA_LOCK = threading.Lock()
+
+
+def intern_metadata(metadata):
+    """Returns the canonical Metadata object for the given metadata
+
+    Metadata with the same items, in the same order, always gets the same
+    object, so it's stored once, and serializers can encode it once.
+
+    Args:
+        metadata - dictionary (or Metadata) containing the metadata
+
+    Returns:
+        The shared, immutable Metadata object
+    """
+    key = tuple(metadata.items())
+    md = _METADATA.get(key)
+    if md is None:
+        with _METADATA_LOCK:
+            md = _METADATA.get(key)
+            if md is None:
+                md = Metadata(metadata)
+                _METADATA[key] = md
+    return md
+
+
 class GripConfig(object):
     """Class containing the configuration information
 
@@ -129,6 +248,232 @@ class GripConfig(object):
         self.server = None
         self.jira_rest_api = "rest/api/2/"
         self.sprint_api = None
+        # HTTP transport tuning
+        self.http_pool_connections = 10
+        self.http_pool_maxsize = 10
+        self.http_timeout = 60.0
+        self.http_connect_timeout = 10.0
+        self.http_retries = 3
+        self.http_keep_alive = True
+        # On-disk cache of static REST responses; None disables the cache
+        self.http_cache_dir = None
+        self.http_cache_max_bytes = 64*1024*1024
+        self.http_cache_ttls = ""
+        # Record / replay archive of every REST response; None disables it.
+        # Mode "record" writes the archive, "replay" serves the responses
+        # from it without any network access
+        self.http_cassette = None
+        self.http_cassette_mode = "replay"
+        # Measurement output: "array" (one JSON array) or "lines" (JSON Lines)
+        self.json_format = "array"
+        # Measurement output compression: "none", "gzip" or "xz", and the
+        # number of threads compressing blocks of the output in parallel
+        self.json_compression = "none"
+        self.compression_threads = 1
+        # Number of issues requested per JIRA search page
+        self.page_size = 100
+        # Number of search pages fetched ahead, in parallel; 0 disables
+        self.prefetch_pages = 0
+        # Parse search pages incrementally as they download, instead of
+        # decoding each whole response first
+        self.stream_json = False
+        # Number of projects processed in parallel; 1 processes serially
+        self.project_workers = 1
+        # Number of concurrent requests for batches of independent GETs
+        self.fetch_workers = 1
+        # Path of the on-disk closed-sprint cache; None disables the cache
+        self.sprint_cache = None
+        # alpha1 API user lookups: LRU size and optional on-disk store
+        self.user_cache_size = 1024
+        self.user_cache = None
+        # Number of alpha1 issues fetched and adapted in parallel
+        self.adapt_workers = 1
+        # Number of worker processes running proc_issue (1 processes in the
+        # main process), and the number of consecutive issues per shard
+        # handed to a worker
+        self.process_workers = 1
+        self.process_shard_size = 250
+        # Incremental sync: SQLite file holding the persisted issues and
+        # watermarks (None disables), the minutes of overlap added to each
+        # updated-since query to absorb clock skew, and the hours between
+        # full syncs, which drop issues deleted or moved out of the project
+        # (0 makes every sync a full one)
+        self.issue_store = None
+        self.sync_overlap = 10
+        self.full_sync_hours = 168
+        # Process the issue store without contacting the server
+        self.offline = False
+        # SonarQube server and credentials
+        self.sonarqube_server = "http://localhost:9000/"
+        self.sonarqube_username = "admin"
+        self.sonarqube_password = "admin"
+
+
+class GripTransport(object):
+    """Pooled, keep-alive HTTP transport shared by all REST requests
+
+    Wraps a requests.Session so that connections are reused across requests
+    to the same host, instead of opening a new TCP/TLS connection for every
+    GET.  The threads of a run share the adapter's urllib3 connection pool,
+    which is bounded by pool_maxsize and blocks when every connection is in
+    use.
+
+    Args:
+        pool_connections - number of per-host connection pools to cache
+        pool_maxsize - maximum number of connections kept alive per host
+        timeout - read timeout, in seconds
+        connect_timeout - connect timeout, in seconds
+        retries - number of retries for connection errors and throttling
+                  (429) / gateway responses
+        keep_alive - if False, connections are closed after each request
+        cache - qz_utils.ResponseCache used by get_rest for cacheable
+                endpoints, or None
+        cassette - qz_utils.Cassette every response is recorded to, or
+                   replayed from without any network access, or None
+    """
+    def __init__(self
+                 ,pool_connections=10
+                 ,pool_maxsize=10
+                 ,timeout=60.0
+                 ,connect_timeout=10.0
+                 ,retries=3
+                 ,keep_alive=True
+                 ,cache=None
+                 ,cassette=None):
+        self.timeout = (connect_timeout, timeout)
+        self.cache = cache
+        self.cassette = cassette
+        self.session = requests.Session()
+        retry = Retry(total=retries
+                      ,backoff_factor=0.5
+                      ,status_forcelist=(429, 502, 503, 504)
+                      ,allowed_methods=frozenset(["GET"])
+                      ,respect_retry_after_header=True
+                      ,raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections
+                              ,pool_maxsize=pool_maxsize
+                              ,max_retries=retry
+                              ,pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = "close"
+
+    def get(self, url, authenticate, **kwargs):
+        """GETs the url through the pooled session
+
+        Args:
+            url - string containing the full URL to GET
+            authenticate - tuple containing username and password
+            kwargs - additional keyword arguments for requests
+
+        Returns:
+            The requests.Response object
+        """
+        if self.cassette is not None and self.cassette.replaying:
+            return self._replay(url)
+        kwargs.setdefault('timeout', self.timeout)
+        r = self.session.get(url, auth=authenticate, **kwargs)
+        if self.cassette is not None:
+            # A streamed body is read in full here; iter_content then
+            #   serves it from memory
+            self.cassette.record(url, r.status_code, r.headers, r.content)
+        return r
+
+    def _replay(self, url):
+        # Builds the response for url from the cassette, reading the body
+        #   from the archive as it's consumed
+        recorded = self.cassette.replay(url)
+        if recorded is None:
+            raise requests.exceptions.ConnectionError(
+                "No recorded response for {0}".format(url))
+        r = requests.Response()
+        r.url = url
+        r.status_code = recorded['status']
+        r.headers.update(recorded['headers'])
+        r.raw = self.cassette.open_body(recorded)
+        return r
+
+    def close(self):
+        """Closes all pooled connections, and the cassette"""
+        self.session.close()
+        if self.cassette is not None:
+            self.cassette.close()
+
+
+# The transport shared by every get_rest call, created on first use
+_TRANSPORT = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def parse_ttls(ttl_str):
+    """Parses a list of per-endpoint cache TTLs
+
+    Args:
+        ttl_str - string of comma separated endpoint:seconds pairs, e.g.
+                  "project:86400,rapidviews/list:3600"
+
+    Returns:
+        Dictionary mapping endpoints to TTLs in seconds
+    """
+    ttls = {}
+    for item in ttl_str.split(','):
+        if item.strip():
+            endpoint, seconds = item.rsplit(':', 1)
+            ttls[endpoint.strip()] = float(seconds)
+    return ttls
+
+
+def configure_transport(config):
+    """Builds the shared transport from the HTTP settings in config
+
+    Any previously configured transport is closed and replaced
+
+    Args:
+        config - GripConfig object containing the http_* settings
+
+    Returns:
+        The new GripTransport object
+    """
+    global _TRANSPORT
+    cache = None
+    cassette = None
+    if config.http_cassette:
+        # The archive has to hold every response, so the response cache
+        #   isn't used with a cassette
+        cassette = Cassette(config.http_cassette, config.http_cassette_mode)
+    elif config.http_cache_dir:
+        cache = ResponseCache(config.http_cache_dir
+                              ,config.http_cache_max_bytes
+                              ,parse_ttls(config.http_cache_ttls))
+    transport = GripTransport(pool_connections=config.http_pool_connections
+                              ,pool_maxsize=config.http_pool_maxsize
+                              ,timeout=config.http_timeout
+                              ,connect_timeout=config.http_connect_timeout
+                              ,retries=config.http_retries
+                              ,keep_alive=config.http_keep_alive
+                              ,cache=cache
+                              ,cassette=cassette)
+    with _TRANSPORT_LOCK:
+        old_transport = _TRANSPORT
+        _TRANSPORT = transport
+    if old_transport is not None:
+        old_transport.close()
+    return transport
+
+
+def get_transport():
+    """Returns the shared transport, creating one with default settings
+    if configure_transport hasn't been called
+
+    Returns:
+        The shared GripTransport object
+    """
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = GripTransport()
+        return _TRANSPORT
 
 
 def usage_message(program_file):
@@ -167,12 +512,61 @@ def get_basename_arg(program_file, argv):
         usage_message(program_file)
         return None
 
+# JIRA's fixed date format: YYYY-MM-DDTHH:MM:SS[.fff](+ZZZZ|+ZZ:ZZ|Z)
+_JIRA_DATETIME = re.compile(r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)"
+                            r"(?:\.(\d{3}))?(?:Z|([+-])(\d\d):?(\d\d))\Z")
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Number of distinct date strings whose timestamps are remembered
+TIMESTAMP_MEMO_SIZE = 65536
+
+
+def parse_timestamp(date_str):
+    """Converts an ISO date string into a timestamp in milliseconds
+
+    JIRA's fixed format is handled with integer arithmetic.  Anything else
+    (or any out of range field) falls back to isodate, so the result is
+    always the same as round(isodate.parse_datetime(date_str).timestamp()
+    * 1000).
+
+    Args:
+        date_str - ISO date string
+
+    Returns:
+        Integer representing the timestamp
+    """
+    fnd = _JIRA_DATETIME.match(date_str) if type(date_str) is str else None
+    if fnd is not None:
+        (year, month, day, hour, minute, second
+         ,millis, sign, off_hour, off_min) = fnd.groups()
+        hour = int(hour)
+        minute = int(minute)
+        second = int(second)
+        if hour < 24 and minute < 60 and second < 60:
+            try:
+                days = (datetime.date(int(year), int(month), int(day))
+                        .toordinal() - _EPOCH_ORDINAL)
+            except ValueError:
+                days = None
+            if days is not None:
+                secs = days * 86400 + hour * 3600 + minute * 60 + second
+                if sign is not None:
+                    offset = int(off_hour) * 3600 + int(off_min) * 60
+                    secs = secs - offset if sign == '+' else secs + offset
+                return secs * 1000 + (int(millis) if millis else 0)
+    dto = isodate.parse_datetime(date_str)
+    return round(dto.timestamp() * 1000)
+
+
+_memo_timestamp = lru_cache(maxsize=TIMESTAMP_MEMO_SIZE)(parse_timestamp)
+
+
 def gen_timestamp(date_str):
     """Converts an ISO datestring into a timestamp suitable for use as a 
     component of a measurement
     
-    The measurement timestamps are in milliseconds, so we multiply the
-    Python value by 1K
+    The measurement timestamps are in milliseconds.  The same date strings
+    come up repeatedly, so results are remembered in a bounded memo
 
     Args:
         date_str - ISO date string
@@ -180,37 +574,434 @@ def gen_timestamp(date_str):
     Returns:
         Integer representing the timestamp
     """
-    #print("gen_timestamp -- date_str == '{}'".format(date_str))
-    dto = isodate.parse_datetime(date_str)
-    return round(dto.timestamp() * 1000)
+    return _memo_timestamp(date_str)
 
 
-def get_rest(url, authenticate):
+def gen_timestamps(date_strs):
+    """Converts a sequence of ISO date strings into timestamps
+
+    Args:
+        date_strs - iterable of ISO date strings
+
+    Returns:
+        List of integers representing the timestamps, in the same order
+    """
+    return list(map(_memo_timestamp, date_strs))
+
+
+def get_rest(url, authenticate, transport=None):
     """GETs the JSON information referenced by the url
 
     Attempts to GET the JSON formatted information linked to by the URL, using
     the specified authentication information.  Converts the JSON formatted
-    data into a Python dictionary for further use.
+    data into a Python dictionary for further use.  The request goes through
+    the shared, pooled transport, so connections are reused between calls.
+    If the transport has a response cache and the URL is one of its
+    endpoints, fresh responses are served from disk and stale ones are
+    revalidated with a conditional request.  If it has a cassette, the
+    response is recorded to it, or replayed from it with no network access.
     
     Args:
         url - string containing the full URL to GET
         authenticate - tuple containg username and password to access the URL
+        transport - GripTransport to use; defaults to the shared transport
 
     Returns:
         Python dictionary representation of the JSON data, if the GET results
         in a good status.
         None otherwise
     """
-    json = None
-    r = requests.get(url , auth=authenticate)
-    if r.status_code == 200:
-        json = r.json()
-        #j = json.loads(r.text)
+    if transport is None:
+        transport = get_transport()
+    cache = transport.cache
+    ttl = None
+    entry = None
+    if cache is not None:
+        ttl = cache.ttl_for(url)
+        if ttl is not None:
+            cache_key = cache.make_key(url, authenticate and authenticate[0])
+            entry = cache.lookup(cache_key)
+            if entry is not None and cache.is_fresh(entry, ttl):
+                return json.loads(entry['body'])
+
+    rest_json = None
+    try:
+        r = transport.get(url
+                          ,authenticate
+                          ,headers=ResponseCache.conditional_headers(entry))
+    except requests.exceptions.RequestException as ex:
+        estr = ("{0}Request failed: '{1}'\n"
+                "{2}Request: '{3}'\n")
+        print(estr.format(ERR_LABEL, ex, ' '*len(ERR_LABEL), url))
+        return rest_json
+    if r.status_code == 304 and entry is not None:
+        # Not modified since it was cached
+        cache.refresh(cache_key, entry)
+        rest_json = json.loads(entry['body'])
+    elif r.status_code == 200:
+        rest_json = r.json()
+        if ttl is not None:
+            cache.store(cache_key, url, r.headers, r.content)
     else:
         estr = ("{0}Bad Status: '{1}' returned from \n"
                 "{2}Request: '{3}'\n")
         print(estr.format(ERR_LABEL, r.status_code, ' '*len(ERR_LABEL), url))
-    return json
+    return rest_json
+
+
+def get_rest_many(urls, authenticate, max_workers=1):
+    """GETs the JSON information referenced by each of the urls
+
+    The requests are made by a bounded pool of worker threads sharing the
+    pooled transport.  Results are returned in the same order as the urls,
+    regardless of the order in which the responses arrive.
+
+    Args:
+        urls - sequence of strings containing the full URLs to GET
+        authenticate - tuple containg username and password to access the URLs
+        max_workers - maximum number of concurrent requests; 1 or less
+                      makes the requests serially
+
+    Returns:
+        List with the get_rest result (dictionary, or None) for each URL
+    """
+    urls = list(urls)
+    if max_workers <= 1 or len(urls) <= 1:
+        return [get_rest(url, authenticate) for url in urls]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as ex:
+        return list(ex.map(lambda url: get_rest(url, authenticate), urls))
+
+
+# Size of the chunks read from the socket by get_rest_stream
+STREAM_CHUNK_SIZE = 64*1024
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WS = re.compile(r'[ \t\n\r]*')
+# Characters that matter when finding the end of a value: outside strings,
+# the brackets and quotes; inside strings, the closing quote and escapes
+_JSON_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_JSON_STRING_SPECIAL = re.compile(r'["\\]')
+_JSON_SCALAR_END = re.compile(r'[,\]}\s]')
+# Marks the start of the array in JsonArrayStream._parse
+_ARRAY_START = object()
+
+
+class JsonArrayStream(object):
+    """Incremental parser for a JSON object holding one large array
+
+    Parses the object from an iterable of chunks (bytes or str), such as a
+    streamed response body, yielding the elements of one array member as
+    they arrive.  Only the unparsed tail of the input and the current
+    element are held in memory, so a large response can be processed, one
+    element at a time, while it is still downloading.
+
+    The object's other members are collected in the fields dictionary.
+    Members that precede the array, like the 'total' of a JIRA search page,
+    are available once read_header returns.  Members that follow it are
+    available when the array has been consumed.  Indexing the stream with
+    the array's key returns the stream itself, and any other key is looked
+    up in fields, so a stream can stand in for the decoded dictionary in
+    code that just iterates over the array.  If the input fails part way
+    through the array, iteration stops and the exception is kept in error.
+
+    Args:
+        chunks - iterable of bytes or str chunks of the JSON text
+        array_key - string with the key of the array member to stream
+        on_close - optional function called when the stream is closed, e.g.
+                   to release the connection
+    """
+    def __init__(self, chunks, array_key, on_close=None):
+        self.array_key = array_key
+        self.fields = {}
+        self.count = 0
+        self.error = None
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._on_close = on_close
+        self._header_read = False
+        self._parser = self._parse()
+
+    def __getitem__(self, key):
+        if key == self.array_key:
+            return self
+        return self.fields[key]
+
+    def get(self, key, default=None):
+        if key == self.array_key:
+            return self
+        return self.fields.get(key, default)
+
+    def read_header(self):
+        """Parses the members that precede the array
+
+        Returns:
+            The fields dictionary
+        """
+        if not self._header_read:
+            self._header_read = True
+            for _ in self._parser:
+                break
+        return self.fields
+
+    def __iter__(self):
+        self.read_header()
+        try:
+            for item in self._parser:
+                self.count += 1
+                yield item
+        except (requests.exceptions.RequestException, ValueError) as ex:
+            # The download failed, or the body was cut short, part way
+            # through the array.  Stop, like get_rest does, but record it so
+            # the caller can tell the array is incomplete
+            self.error = ex
+            print("{0}Streamed response failed: '{1}'".format(ERR_LABEL, ex))
+            self.close()
+        finally:
+            # Once the array has been consumed, or abandoned, there is
+            # nothing more to read
+            if self.finished():
+                self.close()
+
+    def finished(self):
+        """True if the whole object has been parsed"""
+        return self._parser.gi_frame is None
+
+    def drain(self):
+        """Skips any elements that haven't been consumed, so the fields that
+        follow the array are parsed
+
+        Returns:
+            The fields dictionary
+        """
+        for _ in self:
+            pass
+        return self.fields
+
+    def close(self):
+        """Stops parsing and releases the input"""
+        self._parser.close()
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
+    def _fill(self):
+        # Appends the next chunk to the buffer, dropping the parsed part.
+        # Returns False at the end of the input
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            if chunk:
+                self._buf = self._buf[self._pos:] + chunk
+                self._pos = 0
+                return True
+        if not self._eof:
+            self._eof = True
+            tail = self._utf8.decode(b"", final=True)
+            if tail:
+                self._buf = self._buf[self._pos:] + tail
+                self._pos = 0
+                return True
+        return False
+
+    def _peek(self):
+        # Skips whitespace and returns the next character, '' at the end
+        while True:
+            self._pos = _JSON_WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if not ch or ch not in chars:
+            raise ValueError("Expecting one of '{0}' at offset {1}, found "
+                             "'{2}'".format(chars, self._pos, ch))
+        self._pos += 1
+        return ch
+
+    def _value_end(self):
+        # Returns the offset, relative to self._pos, just past the end of
+        # the value starting at self._pos, reading more input as needed.
+        # The scan jumps between the characters that matter, so it can be
+        # resumed where it stopped when more input arrives
+        first = self._buf[self._pos]
+        if first not in '{["':
+            while True:
+                fnd = _JSON_SCALAR_END.search(self._buf, self._pos)
+                if fnd is not None:
+                    return fnd.start() - self._pos
+                if not self._fill():
+                    return len(self._buf) - self._pos
+        depth = 0
+        in_string = False
+        scan = 0
+        while True:
+            buf = self._buf
+            if in_string:
+                fnd = _JSON_STRING_SPECIAL.search(buf, self._pos + scan)
+                if fnd is not None and fnd.group() == '"':
+                    in_string = False
+                    scan = fnd.end() - self._pos
+                    if depth == 0:
+                        return scan
+                    continue
+                if fnd is not None and fnd.end() < len(buf):
+                    # skip the escaped character
+                    scan = fnd.end() + 1 - self._pos
+                    continue
+                if fnd is not None:
+                    scan = fnd.start() - self._pos
+            else:
+                fnd = _JSON_STRUCTURAL.search(buf, self._pos + scan)
+                if fnd is not None:
+                    scan = fnd.end() - self._pos
+                    ch = fnd.group()
+                    if ch == '"':
+                        in_string = True
+                    elif ch in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return scan
+                    continue
+            if fnd is None:
+                scan = len(buf) - self._pos
+            if not self._fill():
+                raise ValueError("Truncated JSON value at offset "
+                                 "{0}".format(self._pos))
+
+    def _read_value(self):
+        # Decodes the value starting at the next non-whitespace character.
+        # Values that fit in the buffer are decoded directly; otherwise the
+        # end of the value is found first, so it is decoded only once
+        if not self._peek():
+            raise ValueError("Expecting a value, found the end of the input")
+        if self._buf[self._pos] in '{["':
+            try:
+                value, end = _JSON_DECODER.raw_decode(self._buf, self._pos)
+                self._pos = end
+                return value
+            except ValueError:
+                if self._eof:
+                    raise
+        # _value_end may move the value to the start of the buffer
+        end = self._value_end()
+        end += self._pos
+        value, _ = _JSON_DECODER.raw_decode(self._buf, self._pos)
+        self._pos = end
+        return value
+
+    def _parse(self):
+        # Generator doing the parse: yields _ARRAY_START once the header is
+        # read, then each element of the array
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._read_value()
+            self._expect(':')
+            if key == self.array_key and self._peek() == '[':
+                self._pos += 1
+                yield _ARRAY_START
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._read_value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.fields[key] = self._read_value()
+            if self._expect(',}') == '}':
+                break
+
+
+def get_rest_stream(url, authenticate, array_key, transport=None):
+    """GETs the JSON object referenced by the url as a JsonArrayStream
+
+    Like get_rest, but the response body is read from the socket in chunks
+    and parsed incrementally, so the elements of the array_key member can
+    be processed one at a time while the response is still downloading.
+    Responses for URLs with a cache TTL are read in full, since the body
+    has to be stored, and then parsed the same way; so are responses being
+    recorded to a cassette.  Replayed responses are streamed from the
+    cassette's archive.
+
+    Args:
+        url - string containing the full URL to GET
+        authenticate - tuple containg username and password to access the URL
+        array_key - string with the key of the array member to stream
+        transport - GripTransport to use; defaults to the shared transport
+
+    Returns:
+        JsonArrayStream with its header already read, if the GET results in
+        a good status.
+        None otherwise
+    """
+    if transport is None:
+        transport = get_transport()
+    cache = transport.cache
+    ttl = None
+    entry = None
+    if cache is not None:
+        ttl = cache.ttl_for(url)
+        if ttl is not None:
+            cache_key = cache.make_key(url, authenticate and authenticate[0])
+            entry = cache.lookup(cache_key)
+            if entry is not None and cache.is_fresh(entry, ttl):
+                return JsonArrayStream([entry['body']], array_key)
+
+    stream = None
+    try:
+        r = transport.get(url
+                          ,authenticate
+                          ,headers=ResponseCache.conditional_headers(entry)
+                          ,stream=True)
+        if r.status_code == 304 and entry is not None:
+            # Not modified since it was cached
+            r.close()
+            cache.refresh(cache_key, entry)
+            stream = JsonArrayStream([entry['body']], array_key)
+        elif r.status_code == 200 and ttl is not None:
+            cache.store(cache_key, url, r.headers, r.content)
+            stream = JsonArrayStream([r.content], array_key)
+        elif r.status_code == 200:
+            stream = JsonArrayStream(r.iter_content(STREAM_CHUNK_SIZE)
+                                     ,array_key
+                                     ,r.close)
+        else:
+            r.close()
+            estr = ("{0}Bad Status: '{1}' returned from \n"
+                    "{2}Request: '{3}'\n")
+            print(estr.format(ERR_LABEL
+                              ,r.status_code
+                              ,' '*len(ERR_LABEL)
+                              ,url))
+            return stream
+        stream.read_header()
+    except (requests.exceptions.RequestException, ValueError) as ex:
+        if stream is not None:
+            stream.close()
+        estr = ("{0}Request failed: '{1}'\n"
+                "{2}Request: '{3}'\n")
+        print(estr.format(ERR_LABEL, ex, ' '*len(ERR_LABEL), url))
+        stream = None
+    return stream
+
+
+# Heuristic pattern for a requirement: a line starting with a bullet,
+# number or heading marker
+_REQUIREMENT = re.compile(r"(?m)^\s*[\-\*\#0-9]")
+
+# Joins descriptions for a batch scan.  The NUL line can't be part of a
+# match, so matches never cross from one description into the next
+_REQUIREMENT_SEP = "\n\x00\n"
 
 
 def get_requirement_cnt(description, issues_w_req, issue_type):
@@ -233,11 +1024,39 @@ def get_requirement_cnt(description, issues_w_req, issue_type):
     """
     requirement_cnt = 0
     if ((description is not None) and (issue_type in issues_w_req)):
-        requirement_cnt = len(re.findall("(?m)^\s*[\-\*\#0-9]", description))
+        requirement_cnt = len(_REQUIREMENT.findall(description))
     
     return requirement_cnt
 
 
+def get_requirement_cnts(descriptions):
+    """Gets the number of requirements in each of a group of descriptions
+
+    The descriptions are joined and scanned in a single pass, and each
+    match is attributed to its description by position.  The counts are
+    the same as get_requirement_cnt would give for each description.
+    
+    Args:
+        descriptions - sequence of strings to be scanned; None entries are
+                       counted as 0
+
+    Returns:
+        List with the number of requirements found in each description
+    """
+    starts = []
+    pieces = []
+    pos = 0
+    for descr in descriptions:
+        starts.append(pos)
+        descr = descr or ""
+        pieces.append(descr)
+        pos += len(descr) + len(_REQUIREMENT_SEP)
+    counts = [0] * len(starts)
+    for fnd in _REQUIREMENT.finditer(_REQUIREMENT_SEP.join(pieces)):
+        counts[bisect_right(starts, fnd.start()) - 1] += 1
+    return counts
+
+
 def load_config(cfg_path):
     """Loads the configuration file from the specified path
 
@@ -280,20 +1099,532 @@ def load_config(cfg_path):
         for attr in ['sq_metadata', 'verbose']:
             setattr(cfg_obj,attr,eval(cfg[attr]))
 
+        # Optional numeric / boolean settings keep their GripConfig
+        # defaults when they're absent from the file
+        for attr in ['http_pool_connections'
+                     ,'http_pool_maxsize'
+                     ,'http_retries'
+                     ,'page_size'
+                     ,'prefetch_pages'
+                     ,'project_workers'
+                     ,'fetch_workers'
+                     ,'user_cache_size'
+                     ,'adapt_workers'
+                     ,'process_workers'
+                     ,'process_shard_size'
+                     ,'http_cache_max_bytes'
+                     ,'sync_overlap'
+                     ,'full_sync_hours'
+                     ,'compression_threads']:
+            setattr(cfg_obj,attr,cfg.getint(attr
+                                            ,fallback=getattr(cfg_obj,attr)))
+        for attr in ['http_timeout', 'http_connect_timeout']:
+            setattr(cfg_obj,attr,cfg.getfloat(attr
+                                              ,fallback=getattr(cfg_obj,attr)))
+        for attr in ['http_keep_alive', 'offline', 'stream_json']:
+            setattr(cfg_obj,attr,cfg.getboolean(attr
+                                                ,fallback=getattr(cfg_obj,attr)))
+
         GLOBALS['ACCOUNT_NAME'] = cfg_obj.account_name
+        if cfg_obj.json_format in JSON_WRITERS:
+            GLOBALS['JSON_FORMAT'] = cfg_obj.json_format
+        else:
+            err_str = "{0}Unknown json_format: '{1}', using '{2}'"
+            print(err_str.format(ERR_LABEL
+                                 ,cfg_obj.json_format
+                                 ,GLOBALS['JSON_FORMAT']))
+        if cfg_obj.json_compression in COMPRESSORS:
+            GLOBALS['JSON_COMPRESSION'] = cfg_obj.json_compression
+        else:
+            err_str = "{0}Unknown json_compression: '{1}', using '{2}'"
+            print(err_str.format(ERR_LABEL
+                                 ,cfg_obj.json_compression
+                                 ,GLOBALS['JSON_COMPRESSION']))
+        GLOBALS['COMPRESSION_THREADS'] = cfg_obj.compression_threads
+        configure_transport(cfg_obj)
 
         return cfg_obj
     else:
         return None
 
 
+_INF = float('inf')
+
+
+class MeasurementEncoder(object):
+    """Fast JSON serializer for GripMeasurement namedtuples
+
+    The measurement schema is fixed, and a run only produces a handful of
+    distinct names, accounts and metadata values.  Rather than converting
+    each measurement to a dict and running the generic encoder over it,
+    this encoder builds the JSON fragments for each distinct name, account
+    and metadata value once and joins them with the encoded value and
+    timestamp.  The output is byte-for-byte identical to
+    json.dumps(m._asdict()).
+
+    Args:
+        max_metadata - maximum number of distinct metadata values whose
+                       encoding is kept
+    """
+    def __init__(self, max_metadata=4096):
+        self._encode = json.JSONEncoder().encode
+        self._max_metadata = max_metadata
+        self._names = {}
+        self._accounts = {}
+        self._metadata = {}
+        # Metadata objects by id, each kept with its fragment: the reference
+        # keeps the id from being reused, and lookups check identity
+        self._metadata_ids = {}
+    def name_fragment(self, name):
+        frag = '{{"name": {0}, "value": '.format(self._encode(name))
+        self._names[name] = frag
+        return frag
+    def account_fragment(self, account):
+        frag = ', "account": {0}, "timestamp": '.format(self._encode(account))
+        self._accounts[account] = frag
+        return frag
+    def metadata_fragment(self, metadata):
+        frag = ', "metadata": {0}}}'.format(self._encode(metadata))
+        if type(metadata) is Metadata:
+            if len(self._metadata_ids) < self._max_metadata:
+                self._metadata_ids[id(metadata)] = (metadata, frag)
+        elif type(metadata) is dict:
+            try:
+                # Equal dicts with the same key order encode identically
+                key = tuple(metadata.items())
+                if len(self._metadata) < self._max_metadata:
+                    self._metadata[key] = frag
+            except TypeError:
+                # unhashable values, just don't cache the encoding
+                pass
+        return frag
+    def number(self, num):
+        # Mirrors the generic encoder: repr for finite floats and ints
+        num_type = type(num)
+        if num_type is float:
+            if num != num or num in (_INF, -_INF):
+                return self._encode(num)
+            return float.__repr__(num)
+        if num_type is int:
+            return int.__repr__(num)
+        return self._encode(num)
+    def encode(self, m):
+        """Returns the JSON string for the GripMeasurement m"""
+        name, value, account, timestamp, metadata = m
+        try:
+            name_frag = self._names[name]
+        except KeyError:
+            name_frag = self.name_fragment(name)
+        try:
+            account_frag = self._accounts[account]
+        except KeyError:
+            account_frag = self.account_fragment(account)
+        md_frag = None
+        if type(metadata) is Metadata:
+            cached = self._metadata_ids.get(id(metadata))
+            if cached is not None and cached[0] is metadata:
+                md_frag = cached[1]
+        elif type(metadata) is dict:
+            try:
+                md_frag = self._metadata.get(tuple(metadata.items()))
+            except TypeError:
+                pass
+        if md_frag is None:
+            md_frag = self.metadata_fragment(metadata)
+        return "".join((name_frag
+                        ,self.number(value)
+                        ,account_frag
+                        ,self.number(timestamp)
+                        ,md_frag))
+
+
+class MeasurementBatch(object):
+    """Columnar collection of measurements
+
+    Rather than one GripMeasurement namedtuple (plus its metadata dict) per
+    measurement, the batch keeps one typed array per field: values as
+    doubles, timestamps as 64 bit integers, and names, accounts and
+    metadata as integer ids into tables of their distinct values.  Appends
+    are O(1), and each measurement costs a few dozen bytes.  Iterating over
+    the batch produces GripMeasurement namedtuples on the fly, and
+    iter_json serializes the batch straight from the columns.
+
+    Values are stored as floats and timestamps as integers (milliseconds),
+    which is what the import scripts produce.
+    """
+    def __init__(self):
+        self._name_ids = array('I')
+        self._values = array('d')
+        self._account_ids = array('I')
+        self._timestamps = array('q')
+        self._metadata_ids = array('I')
+        self._names = []
+        self._name_index = {}
+        self._accounts = []
+        self._account_index = {}
+        self._metadata = []
+        self._metadata_index = {}
+
+    def __getstate__(self):
+        # The indexes are rebuilt on unpickling, since the metadata index
+        # is keyed by object ids that don't survive the trip
+        state = self.__dict__.copy()
+        for index in ['_name_index', '_account_index', '_metadata_index']:
+            del state[index]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._name_index = {n: i for i, n in enumerate(self._names)}
+        self._account_index = {a: i for i, a in enumerate(self._accounts)}
+        self._metadata_index = {}
+        for md_id, md in enumerate(self._metadata):
+            self._metadata_index.setdefault(self._metadata_key(md), md_id)
+
+    @staticmethod
+    def _metadata_key(metadata):
+        # Equal metadata with the same key order share an id
+        if type(metadata) is Metadata:
+            return id(metadata)
+        if type(metadata) is dict:
+            key = tuple(metadata.items())
+            try:
+                hash(key)
+                return key
+            except TypeError:
+                # unhashable values (e.g. lists), key by the encoding
+                pass
+        return json.dumps(metadata)
+
+    @staticmethod
+    def _intern(table, index, obj, key):
+        obj_id = index.get(key)
+        if obj_id is None:
+            obj_id = len(table)
+            table.append(obj)
+            index[key] = obj_id
+        return obj_id
+
+    def add(self, name, metadata, value=1.0, timestamp=0, account=None):
+        """Appends a measurement given its fields"""
+        # Everything that can fail happens before the id columns are
+        #   appended, so the columns always stay the same length
+        md_id = self._intern(self._metadata
+                             ,self._metadata_index
+                             ,metadata
+                             ,self._metadata_key(metadata))
+        name_id = self._intern(self._names, self._name_index, name, name)
+        account_id = self._intern(self._accounts
+                                  ,self._account_index
+                                  ,account
+                                  ,account)
+        self._values.append(value)
+        try:
+            self._timestamps.append(timestamp)
+        except TypeError:
+            self._values.pop()
+            raise
+        self._name_ids.append(name_id)
+        self._account_ids.append(account_id)
+        self._metadata_ids.append(md_id)
+
+    def append(self, m):
+        """Appends a GripMeasurement namedtuple"""
+        self.add(m.name, m.metadata, m.value, m.timestamp, m.account)
+
+    def extend(self, measurements, value_offsets=None):
+        """Appends a sequence of measurements
+
+        Args:
+            measurements - MeasurementBatch, or iterable of GripMeasurements
+            value_offsets - optional dictionary mapping measurement names to
+                            amounts added to the values of measurements with
+                            that name as they're appended
+
+        Returns:
+            No return value
+        """
+        offsets = value_offsets or {}
+        if not isinstance(measurements, MeasurementBatch):
+            for m in measurements:
+                offset = offsets.get(m.name)
+                if offset:
+                    m = m._replace(value=m.value + offset)
+                self.append(m)
+            return
+        other = measurements
+        name_map = [self._intern(self._names, self._name_index, n, n)
+                    for n in other._names]
+        account_map = [self._intern(self._accounts
+                                    ,self._account_index
+                                    ,a
+                                    ,a) for a in other._accounts]
+        md_map = [self._intern(self._metadata
+                               ,self._metadata_index
+                               ,md
+                               ,self._metadata_key(md))
+                  for md in other._metadata]
+        id_offsets = [offsets.get(n, 0) for n in other._names]
+        self._name_ids.extend(array('I', (name_map[i]
+                                          for i in other._name_ids)))
+        if any(id_offsets):
+            self._values.extend(array('d', (v + id_offsets[i] for v, i
+                                            in zip(other._values
+                                                   ,other._name_ids))))
+        else:
+            self._values.extend(other._values)
+        self._account_ids.extend(array('I', (account_map[i]
+                                             for i in other._account_ids)))
+        self._timestamps.extend(other._timestamps)
+        self._metadata_ids.extend(array('I', (md_map[i]
+                                              for i in other._metadata_ids)))
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __getitem__(self, idx):
+        return GripMeasurement(name=self._names[self._name_ids[idx]]
+                               ,value=self._values[idx]
+                               ,account=self._accounts[self._account_ids[idx]]
+                               ,timestamp=self._timestamps[idx]
+                               ,metadata=self._metadata[self._metadata_ids[idx]])
+
+    def __iter__(self):
+        names = self._names
+        accounts = self._accounts
+        metadata = self._metadata
+        for n, v, a, t, md in zip(self._name_ids
+                                  ,self._values
+                                  ,self._account_ids
+                                  ,self._timestamps
+                                  ,self._metadata_ids):
+            yield GripMeasurement(names[n], v, accounts[a], t, metadata[md])
+
+    def sort(self):
+        """Stable sort of the measurements by timestamp
+
+        Uses numpy's argsort when numpy is available
+        """
+        if numpy is not None:
+            order = numpy.argsort(numpy.frombuffer(self._timestamps
+                                                   ,dtype=numpy.int64)
+                                  ,kind='stable')
+            for attr in ['_name_ids', '_values', '_account_ids'
+                         ,'_timestamps', '_metadata_ids']:
+                col = getattr(self, attr)
+                np_col = numpy.frombuffer(col, dtype=_NUMPY_TYPES[col.typecode])
+                setattr(self, attr, array(col.typecode
+                                          ,np_col[order].tobytes()))
+        else:
+            order = sorted(range(len(self._timestamps))
+                           ,key=self._timestamps.__getitem__)
+            for attr in ['_name_ids', '_values', '_account_ids'
+                         ,'_timestamps', '_metadata_ids']:
+                col = getattr(self, attr)
+                setattr(self, attr, array(col.typecode
+                                          ,[col[i] for i in order]))
+
+    def iter_json(self, encoder=None):
+        """Generator yielding the JSON string for each measurement
+
+        The fragments for each distinct name, account and metadata are
+        encoded once per id, so no GripMeasurement or dict is built.  The
+        output is identical to MeasurementEncoder.encode.
+
+        Args:
+            encoder - MeasurementEncoder to use for the fragments
+
+        Returns:
+            Yields one JSON string per measurement
+        """
+        if encoder is None:
+            encoder = MeasurementEncoder()
+        name_frags = [encoder.name_fragment(n) for n in self._names]
+        account_frags = [encoder.account_fragment(a) for a in self._accounts]
+        md_frags = [encoder.metadata_fragment(md) for md in self._metadata]
+        number = encoder.number
+        join = "".join
+        for n, v, a, t, md in zip(self._name_ids
+                                  ,self._values
+                                  ,self._account_ids
+                                  ,self._timestamps
+                                  ,self._metadata_ids):
+            yield join((name_frags[n]
+                        ,number(v)
+                        ,account_frags[a]
+                        ,int.__repr__(t)
+                        ,md_frags[md]))
+
+
+# numpy dtypes matching the MeasurementBatch array typecodes
+_NUMPY_TYPES = {'I':'uint32', 'd':'float64', 'q':'int64'}
+
+
+def iter_json_records(measurements):
+    """Yields the JSON string for each measurement, using the columnar
+    path for MeasurementBatch objects"""
+    if isinstance(measurements, MeasurementBatch):
+        return measurements.iter_json()
+    return map(MeasurementEncoder().encode, measurements)
+
+
+def write_json(measurements, out_file, batch_size=1024):
+    """Streams the measurements to out_file as a JSON array
+
+    Each GripMeasurement is serialized on its own and written in small
+    batches, so memory use doesn't grow with the number of measurements.
+    The output is byte-for-byte what json.dumps produces for the whole list.
+
+    Args:
+        measurements - MeasurementBatch, or iterable of GripMeasurement
+                       namedtuples
+        out_file - file object opened for writing text
+        batch_size - number of measurements joined per write
+
+    Returns:
+        Number of measurements written
+    """
+    verbose = GLOBALS['VERBOSE']
+    cnt = 0
+    out_file.write("[")
+    batch = []
+    for m_str in iter_json_records(measurements):
+        if verbose:
+            print(m_str)
+        if cnt:
+            batch.append(", ")
+        batch.append(m_str)
+        cnt += 1
+        if len(batch) >= 2 * batch_size:
+            out_file.write("".join(batch))
+            batch = []
+    batch.append("]")
+    out_file.write("".join(batch))
+    return cnt
+
+
+def write_json_lines(measurements, out_file, batch_size=1024):
+    """Streams the measurements to out_file as JSON Lines
+
+    Writes one JSON object per measurement, each on its own line, so
+    consumers can start reading, or split the file, without parsing all
+    of it.
+
+    Args:
+        measurements - MeasurementBatch, or iterable of GripMeasurement
+                       namedtuples
+        out_file - file object opened for writing text
+        batch_size - number of measurements joined per write
+
+    Returns:
+        Number of measurements written
+    """
+    verbose = GLOBALS['VERBOSE']
+    cnt = 0
+    batch = []
+    for m_str in iter_json_records(measurements):
+        if verbose:
+            print(m_str)
+        batch.append(m_str)
+        batch.append("\n")
+        cnt += 1
+        if len(batch) >= 2 * batch_size:
+            out_file.write("".join(batch))
+            batch = []
+    out_file.write("".join(batch))
+    return cnt
+
+
+def gzip_block(data):
+    # Each block is a complete gzip member; members can be concatenated
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def xz_block(data):
+    # Each block is a complete xz stream; streams can be concatenated
+    return lzma.compress(data, format=lzma.FORMAT_XZ, preset=6)
+
+
+# Maps each json_compression setting to its block compressor and file
+# extension suffix
+COMPRESSORS = {"none":(None, "")
+               ,"gzip":(gzip_block, ".gz")
+               ,"xz":(xz_block, ".xz")
+               }
+
+
+class BlockCompressWriter(object):
+    """Text file-like object that compresses its output in blocks
+
+    Text written to the object is collected into blocks of block_size
+    characters.  Each block is encoded as UTF-8 and compressed on its own,
+    by a pool of threads (zlib and lzma release the GIL while compressing),
+    and the compressed blocks are written to the underlying file in order.
+    The result is a multi-member gzip file, or multi-stream xz file, that
+    standard tools decompress as a single file.
+
+    Args:
+        raw_file - file object opened for writing bytes
+        compress - function compressing a bytes block into a complete
+                   gzip member / xz stream
+        threads - number of compression threads; 1 compresses inline
+        block_size - number of characters per compressed block
+    """
+    def __init__(self, raw_file, compress, threads=1, block_size=4*1024*1024):
+        self._raw_file = raw_file
+        self._compress = compress
+        self._block_size = block_size
+        self._pieces = []
+        self._pending_size = 0
+        self._executor = None
+        self._in_flight = deque()
+        self._max_in_flight = 2 * threads
+        if threads > 1:
+            self._executor = ThreadPoolExecutor(max_workers=threads)
+    def write(self, text):
+        self._pieces.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self._block_size:
+            self._submit()
+        return len(text)
+    def _submit(self):
+        data = "".join(self._pieces).encode('utf-8')
+        self._pieces = []
+        self._pending_size = 0
+        if self._executor is None:
+            self._raw_file.write(self._compress(data))
+            return
+        self._in_flight.append(self._executor.submit(self._compress, data))
+        while len(self._in_flight) >= self._max_in_flight:
+            self._raw_file.write(self._in_flight.popleft().result())
+    def close(self):
+        """Compresses any remaining text, then closes the underlying file"""
+        try:
+            if self._pending_size:
+                self._submit()
+            while self._in_flight:
+                self._raw_file.write(self._in_flight.popleft().result())
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._raw_file.close()
+
+
+# Maps each json_format setting to its writer and file extension
+JSON_WRITERS = {"array":(write_json, ".json")
+                ,"lines":(write_json_lines, ".jsonl")
+                }
+
+
 def gen_json(measurements, json_basename):
     """Generates a JSON representation of the measurements and writes it out
 
-    Converts each element of measurements from a GripMeasurement namedtuple
-    into a JSON representation and then adds it to a list of JSON objects.
-    Once all objects are on the new list, a dated output file is created
-    and the new JSON list is written to the file.
+    A dated output file is created and the measurements are streamed into
+    it, one GripMeasurement at a time, through a large write buffer.  The
+    file holds either a single JSON array or, if the json_format setting is
+    "lines", one JSON object per line.  If the json_compression setting is
+    "gzip" or "xz" the output is compressed, in parallel blocks when
+    compression_threads is more than 1.
     
     Args:
         measurements - collection containing a traversable group of
@@ -304,17 +1635,27 @@ def gen_json(measurements, json_basename):
     Returns:
         No returned value
     """
-    measurement_list = [m._asdict() for m in measurements]
-    json_string = json.dumps(measurement_list)
-    if GLOBALS['VERBOSE']:
-        print("\n\n{0}\n\n".format(json_string))
-
+    writer, extension = JSON_WRITERS[GLOBALS['JSON_FORMAT']]
+    compress, compress_ext = COMPRESSORS[GLOBALS['JSON_COMPRESSION']]
     date_str = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    json_filename = json_basename + date_str + ".json"
-    json_file = openfile(json_filename,'w')
+    json_filename = json_basename + date_str + extension + compress_ext
+    if compress is None:
+        json_file = openfile(json_filename, 'w', buffering=JSON_BUFFER_SIZE)
+    else:
+        json_file = openfile(json_filename, 'wb', buffering=JSON_BUFFER_SIZE)
+        if json_file is not None:
+            json_file = BlockCompressWriter(json_file
+                                            ,compress
+                                            ,GLOBALS['COMPRESSION_THREADS'])
     if json_file is not None:
-        json_file.write(json_string)
-        json_file.close()
+        if GLOBALS['VERBOSE']:
+            print("\n")
+        try:
+            writer(measurements, json_file)
+        finally:
+            json_file.close()
+        if GLOBALS['VERBOSE']:
+            print("\n")
     else:
         err_str = "{0}Unable to open JSON output file: '{1}'"
         print(err_str.format(ERR_LABEL, json_filename))
@@ -34,8 +34,12 @@ __status__ = "Prototype"
 __version__ = "0.01"
 
 
+import os
 import sys
 import json
+import threading
+import time
+import urllib.parse
 import requests
 import isodate
 import configparser
@@ -43,26 +47,40 @@ import datetime
 
 import textwrap
 import re
+from collections import deque
 from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from collections import OrderedDict
-from operator import itemgetter
 
 from grip_import import GLOBALS
 from grip_import import ERR_LABEL
 from grip_import import NOTE_LABEL
 from grip_import import gen_timestamp
 from grip_import import get_rest
+from grip_import import get_rest_many
+from grip_import import get_rest_stream
 from grip_import import get_requirement_cnt
+from grip_import import get_requirement_cnts
 from grip_import import load_config
 from grip_import import gen_json
 from grip_import import make_measurement
+from grip_import import MeasurementBatch
+from grip_import import intern_metadata
 from grip_import import get_basename_arg
 from qz_utils import openfile
+from qz_utils import validpath
+from jira_store import IssueStore
 
 
 # Should script output be measurements, or a dump
 MEASUREMENTS_OUT = True
 
+# Obsolete version of the REST API, whose issues need to be adapted
+ALPHA1_API = "rest/api/2.0.alpha1/"
+
 
 #
 # Set of adapter methods to encapsulate the GripMeasurement object
@@ -121,6 +139,14 @@ def sprints_closed(timestamp, metadata):
                             )
 
 
+# Measurements whose values are running totals, mapped to the Counters
+# attribute holding the count they're based on.  Used to rebase the totals
+# when the results of separately processed projects are merged.
+RUNNING_TOTALS = {"measurement.defects":"defects"
+                  ,"measurement.requirements":"requirements"
+                  }
+
+
 # Counters
 class Counter(object):
     def __init__(self):
@@ -152,6 +178,11 @@ class Counter(object):
     @total.setter
     def total(self, newval):
         self._total = newval
+    def merge(self, other):
+        self._created += other.created
+        self._open += other.open
+        self._closed += other.closed
+        self._total += other.total
 
 
 class Counters(object):
@@ -160,7 +191,7 @@ class Counters(object):
         self._issues = Counter()
         self._requirements = Counter()
         self._sprints = Counter()
-        self._measurements = []
+        self._measurements = MeasurementBatch()
         self._contributors = {}
     @property
     def defects(self):
@@ -180,6 +211,189 @@ class Counters(object):
     @property
     def contributors(self):
         return self._contributors
+    def merge(self, other):
+        """Merges the results accumulated by another Counters object
+
+        other is treated as having been processed after everything already
+        in this object, so the running totals in its measurements are
+        rebased by this object's totals.  Merging per-project Counters in
+        project order therefore gives the same result as processing the
+        projects serially with a single Counters object.
+
+        Args:
+            other - Counters object to merge into this one
+
+        Returns:
+            No return value
+        """
+        bases = {}
+        for name, attr in RUNNING_TOTALS.items():
+            bases[name] = getattr(self, attr).total
+        self._measurements.extend(other.measurements, value_offsets=bases)
+        self._contributors.update(other.contributors)
+        self._defects.merge(other.defects)
+        self._issues.merge(other.issues)
+        self._requirements.merge(other.requirements)
+        self._sprints.merge(other.sprints)
+
+
+def save_json_file(path, obj):
+    """Writes obj to a JSON file, replacing the file atomically
+
+    The JSON is written to a temporary file in the same directory, which
+    then replaces the file, so a crash or error while writing leaves the
+    previous contents intact rather than a truncated file.
+
+    Args:
+        path - string containing the path of the file
+        obj - JSON serializable object
+
+    Returns:
+        True if the file was written, False otherwise
+    """
+    tmp_path = path + ".tmp"
+    tmp_file = openfile(tmp_path, 'w')
+    if tmp_file is None:
+        return False
+    try:
+        with tmp_file:
+            json.dump(obj, tmp_file)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+class SprintCache(object):
+    """On-disk cache of the end times of closed sprints
+
+    A closed sprint's endTime never changes, so once it has been extracted
+    from the sprint's burndown chart it's stored here, keyed by
+    (rapidViewId, sprintId), and the chart doesn't need to be downloaded
+    again on later runs.  The cache is stored as a JSON object.
+
+    Args:
+        path - string containing the path of the cache file
+    """
+    def __init__(self, path):
+        self._path = path
+        self._end_times = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if validpath(path, 'r') is not None:
+            cache_file = openfile(path, 'r')
+            if cache_file is not None:
+                try:
+                    self._end_times = json.load(cache_file)
+                except ValueError:
+                    err_str = "{0}Ignoring unreadable sprint cache: '{1}'"
+                    print(err_str.format(ERR_LABEL, path))
+                finally:
+                    cache_file.close()
+    @staticmethod
+    def _key(view_id, sprint_id):
+        return "{0}:{1}".format(view_id, sprint_id)
+    def get(self, view_id, sprint_id):
+        return self._end_times.get(self._key(view_id, sprint_id))
+    def put(self, view_id, sprint_id, end_time):
+        with self._lock:
+            self._end_times[self._key(view_id, sprint_id)] = end_time
+            self._dirty = True
+    def save(self):
+        """Writes the cache back to disk, if it has changed"""
+        if not self._dirty:
+            return
+        with self._lock:
+            if save_json_file(self._path, self._end_times):
+                self._dirty = False
+
+
+class UserCache(object):
+    """Bounded LRU cache of JIRA user details, keyed by the user's URL
+
+    Used by the alpha1 adapter, which would otherwise GET the reporter and
+    assignee of every issue, even though the same users appear over and over.
+    Concurrent lookups of a URL that isn't cached yet share a single request.
+    If a path is given, the cache is loaded from, and saved to, a JSON file
+    so that users are only resolved once across runs.
+
+    Args:
+        maxsize - maximum number of users kept in the cache
+        path - string containing the path of the cache file, or None
+    """
+    def __init__(self, maxsize=1024, path=None):
+        self._maxsize = maxsize
+        self._path = path
+        self._users = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        if path is not None and validpath(path, 'r') is not None:
+            cache_file = openfile(path, 'r')
+            if cache_file is not None:
+                try:
+                    for url, info in json.load(cache_file):
+                        self._store(url, info)
+                except ValueError:
+                    err_str = "{0}Ignoring unreadable user cache: '{1}'"
+                    print(err_str.format(ERR_LABEL, path))
+                finally:
+                    cache_file.close()
+    def _store(self, url, info):
+        # Only the fields used by the adapter are kept; caller holds the lock
+        self._users[url] = {"displayName":info['displayName']
+                            ,"emailAddress":info['emailAddress']
+                            }
+        self._users.move_to_end(url)
+        while len(self._users) > self._maxsize:
+            self._users.popitem(last=False)
+    def lookup(self, url, authenticate):
+        """Returns the user details for url, GETting them if necessary
+
+        Args:
+            url - string containing the user's self URL
+            authenticate - tuple containing username & password
+
+        Returns:
+            Dictionary with the user's displayName and emailAddress, or None
+            if the user couldn't be retrieved
+        """
+        with self._lock:
+            info = self._users.get(url)
+            if info is not None:
+                self._users.move_to_end(url)
+                return info
+            future = self._pending.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[url] = future
+        if not owner:
+            return future.result()
+
+        try:
+            info = get_rest(url, authenticate)
+            with self._lock:
+                if info is not None:
+                    self._store(url, info)
+                    info = self._users[url]
+            future.set_result(info)
+        except Exception as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[url]
+        return info
+    def save(self):
+        """Writes the cache to its file, if it has one"""
+        if self._path is None:
+            return
+        with self._lock:
+            save_json_file(self._path, list(self._users.items()))
 
 
 def build_proj_name2key_map(projects):
@@ -271,21 +485,108 @@ def get_project(issue):
     return proj
 
 
+# Shared Metadata object for each project, see make_metadata
+_PROJECT_METADATA = {}
+
+
 def make_metadata(project):
-    """Utility method to create a metadata dictionary appropriate for
-    measurements generated by this script
+    """Utility method to get the metadata appropriate for measurements
+    generated by this script
 
     This is where you'd edit to change the format / contents of the 
-    measurement's metadata field
+    measurement's metadata field.  The metadata is interned, so every
+    measurement for a project shares one immutable Metadata object
 
     Args:
         project - project that is associated with this issue
 
     Returns:
-        Dictionary containing the defined metadata
-        strings
+        Metadata object (a read-only dictionary) containing the defined
+        metadata
+    """
+    metadata = _PROJECT_METADATA.get(project)
+    if metadata is None:
+        metadata = intern_metadata({"project":project})
+        _PROJECT_METADATA[project] = metadata
+    return metadata
+
+
+# Key of the processing record kept on each issue dictionary, see get_record
+RECORD_KEY = "_grip"
+
+
+def get_record(issue):
+    """Utility method to return the issue's processing record
+
+    The record is a dictionary, kept on the issue, that caches values
+    derived from the issue while it is processed, so they are only computed
+    once per issue
+
+    Args:
+        issue - dictionary representing an issue
+
+    Returns:
+        Dictionary with the issue's cached values
+    """
+    record = issue.get(RECORD_KEY)
+    if record is None:
+        record = issue[RECORD_KEY] = {}
+    return record
+
+
+def get_issue_metadata(issue):
+    """Returns the measurement metadata for the issue's project, cached on
+    the issue's processing record
+    """
+    record = get_record(issue)
+    metadata = record.get('metadata')
+    if metadata is None:
+        metadata = record['metadata'] = make_metadata(get_project(issue))
+    return metadata
+
+
+def get_issue_requirement_cnt(issue, issues_w_requirements):
+    """Gets the number of requirements in the issue's description
+
+    The description is only scanned the first time, after that the count
+    is taken from the issue's processing record
+
+    Args:
+        issue - dictionary representing the issue to be checked
+        issues_w_requirements - collection of issue types that have requirements
+
+    Returns:
+        The number of requirements found in the description
+    """
+    record = get_record(issue)
+    reqmnt_cnt = record.get('requirement_cnt')
+    if reqmnt_cnt is None:
+        i_fields = issue['fields']
+        reqmnt_cnt = get_requirement_cnt(i_fields['description']
+                                         ,issues_w_requirements
+                                         ,i_fields['issuetype']['name']
+                                         )
+        record['requirement_cnt'] = reqmnt_cnt
+    return reqmnt_cnt
+
+
+def prime_requirement_cnts(issues, issues_w_requirements):
+    """Counts the requirements for a group of issues with a single scan, and
+    caches each count on the issue's processing record
+
+    Args:
+        issues - list of issue dictionaries
+        issues_w_requirements - collection of issue types that have requirements
+
+    Returns:
+        No return value
     """
-    return {"project":project}
+    scanned = [i for i in issues
+               if i is not None
+               and i['fields']['issuetype']['name'] in issues_w_requirements]
+    descriptions = [i['fields']['description'] for i in scanned]
+    for i, reqmnt_cnt in zip(scanned, get_requirement_cnts(descriptions)):
+        get_record(i)['requirement_cnt'] = reqmnt_cnt
 
 
 def check_open_requirements(issue
@@ -309,10 +610,7 @@ def check_open_requirements(issue
         No return value
     """
     i_fields = issue['fields']
-    reqmnt_cnt = get_requirement_cnt(i_fields['description']
-                                     ,issues_w_requirements
-                                     ,i_fields['issuetype']['name']
-                                     )
+    reqmnt_cnt = get_issue_requirement_cnt(issue, issues_w_requirements)
     if reqmnt_cnt > 0:
         if GLOBALS['VERBOSE']:
             fstr = "Adding {0} requirements for: {1}"
@@ -321,7 +619,7 @@ def check_open_requirements(issue
         requirements_counter.total += reqmnt_cnt        
 
         ts = gen_timestamp(i_fields['created'])
-        metadata = make_metadata(get_project(issue))
+        metadata = get_issue_metadata(issue)
         measurements.append(requirements_added(reqmnt_cnt, ts , metadata))
         total = requirements_counter.total
         measurements.append(requirements_total(total, ts, metadata))
@@ -346,15 +644,13 @@ def check_requirements_closed(issue
     Returns:
         No return value
     """
-    reqmnt_cnt = get_requirement_cnt(issue['fields']['description']
-                                     ,issues_w_requirements
-                                     ,issue['fields']['issuetype']['name'])
+    reqmnt_cnt = get_issue_requirement_cnt(issue, issues_w_requirements)
     if reqmnt_cnt > 0:
         requirements_counter.closed += reqmnt_cnt
         requirements_counter.open -= reqmnt_cnt
 
         ts = gen_timestamp(close_date)
-        metadata = make_metadata(get_project(issue))
+        metadata = get_issue_metadata(issue)
         measurements.append(requirements_closed(reqmnt_cnt, ts, metadata))
 
 
@@ -417,7 +713,7 @@ def log_defect_created(issue, defect_counter, measurements):
         fstr = "New Defect: {0} at {1}"
         print(fstr.format(issue['key'], create_datetime))
     ts = gen_timestamp(create_datetime)
-    metadata = make_metadata(get_project(issue))
+    metadata = get_issue_metadata(issue)
     measurements.append(defects_added(ts, metadata))
     total = defect_counter.total
     measurements.append(defects_total(total, ts, metadata))
@@ -426,7 +722,7 @@ def log_defect_created(issue, defect_counter, measurements):
 def log_defect_closed(issue, close_date, defect_counter, measurements):
     defect_counter.closed += 1
     ts = gen_timestamp(close_date)
-    metadata = make_metadata(get_project(issue))
+    metadata = get_issue_metadata(issue)
     measurements.append(defects_closed(ts, metadata))
 
 
@@ -451,59 +747,273 @@ def log_sprint_closed(close_timestamp, project, sprint_counter, measurements):
     measurements.append(sprints_closed(close_timestamp, metadata))
 
 
-def get_sprint_list(api, proj_name2key_map, authenticate):
+def get_sprint_list(api, proj_name2key_map, authenticate, max_workers=1):
     """Retrieves the projects sprints
 
     Sprint data "may" be available through another REST API. We use this
-    API to retrieve information about the project's sprints
+    API to retrieve information about the project's sprints.  The sprint
+    queries for the rapid views are made concurrently
 
     Args:
         api - string containing the URL component for the desired API
         proj_name2key_map - maps from poject names to project keys
         authenticate - tuple containing username & password to log into JIRA
+        max_workers - maximum number of concurrent requests
 
     Returns:
-        List containing sprint dictionaries
+        List of (rapidViewId, sprintId, project key, sprint state) tuples
     """
     sprint_list = []
     view_id_rest = get_rest(api+"rapidviews/list", authenticate)
-    for v in view_id_rest['views']:
-        v_id = v['id']
-        url = api + "sprintquery/{0}?includeHistoricSprints=true".format(v_id)
-        sprint_id_rest = get_rest(url, authenticate)
+    views = view_id_rest['views']
+    url_str = api + "sprintquery/{0}?includeHistoricSprints=true"
+    urls = [url_str.format(v['id']) for v in views]
+    sprint_rests = get_rest_many(urls, authenticate, max_workers)
+    for v, sprint_id_rest in zip(views, sprint_rests):
+        if sprint_id_rest is None:
+            continue
         proj = get_proj_from_view(v, proj_name2key_map)
         for s in sprint_id_rest['sprints']:
-            sprint_list.append((v_id, s['id'], proj))
+            sprint_list.append((v['id'], s['id'], proj, s.get('state')))
             
     return sprint_list
     
 
-def proc_sprints(api, proj_name2key_map, authenticate, counters):
+def get_search_page(search_url, authenticate, start_at, page_size
+                    ,stream=False):
+    """Retrieves a single page of JIRA search results
+
+    Args:
+        search_url - string containing the search URL, including the jql,
+                     without startAt or maxResults parameters
+        authenticate - tuple containing username & password to log into JIRA
+        start_at - index of the first issue to request
+        page_size - number of issues to request
+        stream - if True, the page is parsed incrementally as it downloads
+
+    Returns:
+        The search result dictionary for the page, or None if the page
+        couldn't be retrieved.  With stream, a JsonArrayStream over the
+        page's issues, that can be used like the dictionary
+    """
+    url = "{0}&startAt={1}&maxResults={2}".format(search_url
+                                                   ,start_at
+                                                   ,page_size)
+    if GLOBALS['VERBOSE']:
+        print("Making Request for: {0}".format(url))
+    if stream:
+        return get_rest_stream(url, authenticate, 'issues')
+    return get_rest(url, authenticate)
+
+
+def iter_search_pages(search_url, authenticate, page_size, prefetch=0
+                      ,stream=False):
+    """Generator that walks the pages of a JIRA search
+
+    Requests the search results one page at a time, using the startAt and
+    maxResults parameters, and yields each page as soon as it arrives.  Only
+    one page is held at a time, so memory use depends on the page size
+    rather than the size of the project.  The server may return fewer
+    issues than requested, so the next startAt is based on the number of
+    issues actually received.
+
+    With prefetch > 0, the first page's total is used to compute the
+    remaining startAt offsets, and up to prefetch pages are fetched ahead
+    by a bounded pool of worker threads.  Pages are still yielded in order,
+    so network waits overlap with processing of the current page.
+
+    With stream, each page is a JsonArrayStream: its issues are parsed and
+    yielded as they download, so only one issue is held at a time.  The
+    pages are requested serially, since fetching ahead would mean holding
+    whole responses, and prefetch is ignored.
+
+    Args:
+        search_url - string containing the search URL, including the jql,
+                     without startAt or maxResults parameters
+        authenticate - tuple containing username & password to log into JIRA
+        page_size - number of issues to request per page
+        prefetch - number of pages to fetch ahead; 0 fetches serially
+        stream - if True, parse the pages incrementally as they download
+
+    Returns:
+        Yields the search result dictionary for each page.  Stops at the
+        first page that can't be retrieved
+    """
+    if stream:
+        for page in iter_search_streams(search_url, authenticate, page_size):
+            yield page
+        return
+    start_at = 0
+    page = get_search_page(search_url, authenticate, start_at, page_size)
+    if page is None:
+        return
+    total = page.get('total', 0)
+    step = len(page['issues'])
+    yield page
+    start_at += step
+    if step == 0:
+        return
+
+    if prefetch > 0:
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            def submit(offset):
+                return offset, executor.submit(get_search_page
+                                               ,search_url
+                                               ,authenticate
+                                               ,offset
+                                               ,step)
+
+            offsets = iter(range(start_at, total, step))
+            pending = deque(submit(o) for o in islice(offsets, prefetch))
+            while pending:
+                offset, future = pending.popleft()
+                page = future.result()
+                if page is None:
+                    for _, f in pending:
+                        f.cancel()
+                    return
+                # keep the pool busy while this page is processed
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append(submit(next_offset))
+                yield page
+                received = len(page['issues'])
+                if received < step and offset + received < total:
+                    # The server returned a short page; fetch the gap
+                    # serially so no issues are skipped
+                    gap_end = min(offset + step, total)
+                    for gap_page in iter_search_pages_range(search_url
+                                                            ,authenticate
+                                                            ,offset + received
+                                                            ,gap_end):
+                        yield gap_page
+        return
+
+    while start_at < total:
+        page = get_search_page(search_url, authenticate, start_at, page_size)
+        if page is None:
+            break
+        yield page
+        issue_cnt = len(page['issues'])
+        start_at += issue_cnt
+        if issue_cnt == 0:
+            break
+        total = page.get('total', total)
+
+
+def iter_search_streams(search_url, authenticate, page_size):
+    """Generator that walks the pages of a JIRA search, streaming each one
+
+    Args:
+        search_url - string containing the search URL, without startAt or
+                     maxResults parameters
+        authenticate - tuple containing username & password to log into JIRA
+        page_size - number of issues to request per page
+
+    Returns:
+        Yields a JsonArrayStream for each page.  Any issues left unconsumed
+        are skipped before the next page is requested.  Stops at the first
+        page that can't be retrieved, or fails part way through
+    """
+    start_at = 0
+    total = None
+    while total is None or start_at < total:
+        page = get_search_page(search_url
+                               ,authenticate
+                               ,start_at
+                               ,page_size
+                               ,stream=True)
+        if page is None:
+            break
+        total = page.get('total', total or 0)
+        yield page
+        page.drain()
+        if page.error is not None or page.count == 0:
+            break
+        start_at += page.count
+
+
+def iter_search_pages_range(search_url, authenticate, start_at, end_at):
+    """Serially yields the search pages covering issues [start_at, end_at)
+
+    Args:
+        search_url - string containing the search URL, without startAt or
+                     maxResults parameters
+        authenticate - tuple containing username & password to log into JIRA
+        start_at - index of the first issue to request
+        end_at - index one past the last issue to request
+
+    Returns:
+        Yields the search result dictionary for each page
+    """
+    while start_at < end_at:
+        page = get_search_page(search_url
+                               ,authenticate
+                               ,start_at
+                               ,end_at - start_at)
+        if page is None or not page['issues']:
+            break
+        yield page
+        start_at += len(page['issues'])
+
+
+def proc_sprints(api, proj_name2key_map, authenticate, counters
+                 ,max_workers=1, sprint_cache=None):
     """Retrieves and processes the sprint information
 
     Retrieves the list of sprints associated with the current project, then
     scans the list to extract sprint endTime dates.  These represent the 
-    sprint_closed measurement
+    sprint_closed measurement.  The burndown charts are retrieved
+    concurrently, but the measurements are logged in sprint list order.
+
+    If a sprint cache is given, the end times of closed sprints are taken
+    from the cache, and only new or active sprints are requested from the
+    server.  Newly seen closed sprints are added to the cache.
 
     Args:
         api - string containing the URL component for the desired API
         proj_name2key_map - maps from project names to project keys
         authenticate - tuple containing username & password to log into JIRA
         counters - object containing occurrence counters
+        max_workers - maximum number of concurrent requests
+        sprint_cache - SprintCache object, or None to request every sprint
 
     Returns:
         No return value
     """
-    sprint_list = get_sprint_list(api, proj_name2key_map, authenticate)
+    sprint_list = get_sprint_list(api
+                                  ,proj_name2key_map
+                                  ,authenticate
+                                  ,max_workers)
+    end_times = [None] * len(sprint_list)
+    if sprint_cache is not None:
+        for idx, sp in enumerate(sprint_list):
+            end_times[idx] = sprint_cache.get(sp[0], sp[1])
     url_str = ("rapid/charts/scopechangeburndownchart.json?"
                "rapidViewId={0}&sprintId={1}")
-    for sp in sprint_list:
-        url = api + url_str.format(sp[0], sp[1])
-        sprint_rest = get_rest(url, authenticate)
-        log_sprint_closed(sprint_rest['endTime']
+    to_fetch = [idx for idx, end in enumerate(end_times) if end is None]
+    urls = [api + url_str.format(sprint_list[idx][0], sprint_list[idx][1])
+            for idx in to_fetch]
+    fstr = "{0}Requesting {1} of {2} sprints..."
+    print(fstr.format(NOTE_LABEL, len(urls), len(sprint_list)))
+    sprint_rests = get_rest_many(urls, authenticate, max_workers)
+    for idx, sprint_rest in zip(to_fetch, sprint_rests):
+        if sprint_rest is None:
+            continue
+        sp = sprint_list[idx]
+        end_times[idx] = sprint_rest['endTime']
+        if sprint_cache is not None and sp[3] == "CLOSED":
+            sprint_cache.put(sp[0], sp[1], sprint_rest['endTime'])
+
+    for sp, end_time in zip(sprint_list, end_times):
+        if end_time is None:
+            continue
+        log_sprint_closed(end_time
                           ,sp[2]
                           ,counters.sprints
                           ,counters.measurements)
+    if sprint_cache is not None:
+        sprint_cache.save()
 
 
 def proc_histories(issue, config, counters):
@@ -631,7 +1141,97 @@ def proc_issue(issue, config, counters):
     proc_histories(issue, config, counters)
 
 
-def adapt_2alpha1_issue(issue_ref, config, auth, counters):
+# Configuration used by proc_issue_shard in worker processes, see
+# init_issue_worker
+_WORKER_CONFIG = None
+
+
+def init_issue_worker(config, shared_globals):
+    """Initializer for the processes of the proc_issue pool
+
+    Args:
+        config - configuration object
+        shared_globals - the main process's GLOBALS dictionary
+
+    Returns:
+        No return value
+    """
+    global _WORKER_CONFIG
+    _WORKER_CONFIG = config
+    GLOBALS.update(shared_globals)
+
+
+def make_issue_pool(config):
+    """Creates the pool of worker processes for proc_issues
+
+    Args:
+        config - configuration object
+
+    Returns:
+        ProcessPoolExecutor, or None if config.process_workers is 1 or less
+    """
+    if config.process_workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=config.process_workers
+                               ,initializer=init_issue_worker
+                               ,initargs=(config, dict(GLOBALS)))
+
+
+def proc_issue_shard(issues):
+    """Runs proc_issue over a shard of issues in a worker process
+
+    Args:
+        issues - list of consecutive issue dictionaries
+
+    Returns:
+        Counters object with the shard's partial counts and measurements,
+        as if the shard had been processed from scratch
+    """
+    counters = Counters()
+    prime_requirement_cnts(issues, _WORKER_CONFIG.issues_with_requirements)
+    for i in issues:
+        proc_issue(i, _WORKER_CONFIG, counters)
+    return counters
+
+
+def proc_issues(issues, config, counters, pool=None):
+    """Runs proc_issue over a sequence of issues
+
+    With a pool, the issues are cut into shards of consecutive issues and
+    each shard is processed by a worker process into its own Counters.
+    The partial Counters are merged, in shard order, as the shards finish.
+    Merging rebases the running totals, so the result is the same as
+    processing the issues serially.  At most two shards per worker are in
+    flight, so the issues are consumed as the workers keep up.
+
+    Args:
+        issues - iterable of issue dictionaries
+        config - configuration object
+        counters - object containing occurrence counters
+        pool - ProcessPoolExecutor from make_issue_pool, or None to process
+               the issues in this process
+
+    Returns:
+        No return value
+    """
+    if pool is None:
+        for i in issues:
+            proc_issue(i, config, counters)
+        return
+    pending = deque()
+    issues = iter(issues)
+    while True:
+        shard = list(islice(issues, config.process_shard_size))
+        if not shard:
+            break
+        if len(pending) >= 2 * config.process_workers:
+            counters.merge(pending.popleft().result())
+        pending.append(pool.submit(proc_issue_shard, shard))
+    while pending:
+        counters.merge(pending.popleft().result())
+
+
+def adapt_2alpha1_issue(issue_ref, config, auth, counters, user_cache=None):
     """Adapts an issue from the old version of the API into a structure
     that can be processed by code expecting to work on current data
 
@@ -645,30 +1245,14 @@ def adapt_2alpha1_issue(issue_ref, config, auth, counters):
         issue_ref - dictionary representing the issue to be checked
         config - configuration object
         auth - tuple with username / password for basic authentication
-        counters - object containing occurrence counters
+        counters - object containing occurrence counters; if None, the
+                   issue's users aren't added to the contributors
+        user_cache - UserCache used to resolve reporter / assignee URLs;
+                     if None, every user is requested from the server
 
     Returns:
         An issue compatible with the current vesion of the API
     """
-    def progress_counter():
-        # Since this function needs to make several REST requests for each
-        # issue, it can be quite slow.  This progress count periodically
-        # indicates the progress on stdout, so the user knows that we're
-        # still going
-        try:
-            adapt_2alpha1_issue.iter_counter += 1
-        except AttributeError:
-            reset_progress_counter()
-
-        if (adapt_2alpha1_issue.iter_counter % 10) == 0:
-            f_str = "{0}Processing {1}th issue"
-            print(f_str.format(NOTE_LABEL, adapt_2alpha1_issue.iter_counter))
-
-    def reset_progress_counter():
-        # Resets the iter_counter variable to 1, can also be used to initialize
-        # the counter
-        adapt_2alpha1_issue.iter_counter = 1
-            
     def handle_issuetype(issue):
         # Adapts the issue type to the modern format
         tmp_i = issue['fields']['issuetype']
@@ -679,24 +1263,24 @@ def adapt_2alpha1_issue(issue_ref, config, auth, counters):
         tmp_p = issue['fields']['project']
         tmp_p['key'] =  tmp_p['value']['key']
 
-    def handle_name_field(issue, name_field, auth, contributors):
+    def handle_name_field(issue, name_field, auth):
         # Adapts the name/email address data to a modern
-        # format.  Also adds the name/email addr tuple to the
-        # collection of contributors
+        # format.
         #
         # name_field - specifies which field we'll be transfering
         #
         # Need to make an API call to get the details of the name
         tmp_n = issue['fields'][name_field]
         url = tmp_n['value']['self']
-        name_info = get_rest(url, auth)
+        if user_cache is not None:
+            name_info = user_cache.lookup(url, auth)
+        else:
+            name_info = get_rest(url, auth)
         name = name_info['displayName']
         email = name_info['emailAddress']
         # adapt the specified issue
         tmp_n['displayName'] = name
         tmp_n['emailAddress'] = email
-        # update the contributors collection
-        contributors[email] = name
 
     def handle_description(issue):
         # Some customer issues don't seem to have any text in their
@@ -761,21 +1345,112 @@ def adapt_2alpha1_issue(issue_ref, config, auth, counters):
 
     alpha_issue = get_rest(issue_ref['self'], auth)
     if alpha_issue is not None:
-        progress_counter()
         handle_issuetype(alpha_issue)
         handle_project(alpha_issue)
-        handle_name_field(alpha_issue, "reporter", auth, counters.contributors)
+        handle_name_field(alpha_issue, "reporter", auth)
         make_creator_field(alpha_issue)
         handle_all_datetimes(alpha_issue)
         # Since we won't have a history to process for the alpha issues:
-        handle_name_field(alpha_issue, "assignee", auth, counters.contributors)
+        handle_name_field(alpha_issue, "assignee", auth)
         handle_description(alpha_issue)
         handle_status(alpha_issue)
         make_history(alpha_issue)
-        
+        if counters is not None:
+            add_alpha1_contributors(alpha_issue, counters.contributors)
+
     return alpha_issue
 
 
+def add_alpha1_contributors(alpha_issue, contributors):
+    """Adds the reporter and assignee of an adapted alpha1 issue to the
+    collection of contributors
+
+    Args:
+        alpha_issue - dictionary representing an adapted alpha1 issue
+        contributors - dictionary mapping email addresses to names
+
+    Returns:
+        No return value
+    """
+    for name_field in ["reporter", "assignee"]:
+        name, email = get_name(alpha_issue['fields'][name_field])
+        contributors[email] = name
+
+
+def adapt_2alpha1_issues(issue_refs
+                         ,config
+                         ,auth
+                         ,counters
+                         ,user_cache=None
+                         ,executor=None
+                         ,meter=None):
+    """Generator that adapts a sequence of alpha1 issues
+
+    Each issue needs several REST requests to adapt, so, if an executor is
+    given, the issues are fetched and adapted by its worker threads.  The
+    adapted issues are yielded, and their contributors recorded, in the
+    order of issue_refs either way.
+
+    Args:
+        issue_refs - sequence of issue dictionaries from an alpha1 search
+        config - configuration object
+        auth - tuple with username / password for basic authentication
+        counters - object containing occurrence counters
+        user_cache - UserCache used to resolve reporter / assignee URLs
+        executor - concurrent.futures executor, or None to adapt serially
+        meter - ThroughputMeter to report progress to, or None
+
+    Returns:
+        Yields each adapted issue, or None for issues that couldn't be
+        retrieved
+    """
+    def adapt(issue_ref):
+        return adapt_2alpha1_issue(issue_ref, config, auth, None, user_cache)
+
+    if executor is not None:
+        adapted = executor.map(adapt, issue_refs)
+    else:
+        adapted = map(adapt, issue_refs)
+    for alpha_issue in adapted:
+        if alpha_issue is not None:
+            add_alpha1_contributors(alpha_issue, counters.contributors)
+        if meter is not None:
+            meter.tick()
+        yield alpha_issue
+
+
+class ThroughputMeter(object):
+    """Periodically reports how quickly items are being processed
+
+    Replaces per-item progress messages with a rate, printed at most once
+    per interval.
+
+    Args:
+        label - string describing the items, e.g. "PROJ alpha1 issues"
+        interval - minimum number of seconds between reports
+    """
+    def __init__(self, label, interval=10.0):
+        self._label = label
+        self._interval = interval
+        self._count = 0
+        self._start = time.monotonic()
+        self._last = self._start
+    @property
+    def count(self):
+        return self._count
+    def tick(self, count=1):
+        self._count += count
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self.report()
+    def report(self):
+        elapsed = time.monotonic() - self._start
+        rate = self._count / elapsed if elapsed > 0 else 0.0
+        fstr = "{0}{1}: {2} in {3:.1f}s ({4:.1f}/sec)"
+        print(fstr.format(NOTE_LABEL, self._label, self._count, elapsed, rate))
+
+
 def handle_contributors(contributors):
     """Formats the collection of contributors for pretty printing
 
@@ -843,6 +1518,216 @@ def dump_issue(issue, config, counters):
                               ,i['toString']))
 
 
+def proc_project(proj_key
+                 ,config
+                 ,authenticate
+                 ,counters
+                 ,user_cache=None
+                 ,pool=None):
+    """Retrieves and processes all of the issues for a project
+
+    Args:
+        proj_key - string containing the key of the project to process
+        config - configuration object
+        authenticate - tuple containing username & password to log into JIRA
+        counters - object containing occurrence counters
+        user_cache - UserCache for alpha1 user lookups, or None
+        pool - process pool for proc_issues, or None
+
+    Returns:
+        True if the project's issues could be retrieved, False otherwise
+    """
+    api = config.jira_rest_api
+    if config.issue_store and api != ALPHA1_API:
+        return proc_project_stored(proj_key
+                                   ,config
+                                   ,authenticate
+                                   ,counters
+                                   ,pool)
+    found_issues = False
+    query_str = ("search?jql=project={0}+order+by+created+asc"
+                 "&expand=changelog")
+    query = query_str.format(proj_key)
+    url = "{0}{1}{2}".format(config.server, api, query)
+    print("\nProcessing project: {0}".format(proj_key))
+    print("Making Requests for: {0}".format(url))
+    alpha1 = (api == ALPHA1_API)
+    executor = None
+    meter = None
+    if alpha1:
+        # obsolete version of the API, we'll need to adapt the issues for
+        # processing by these functions
+        if config.adapt_workers > 1:
+            executor = ThreadPoolExecutor(max_workers=config.adapt_workers)
+        meter = ThroughputMeter("{0} alpha1 issues adapted".format(proj_key))
+    def project_issues():
+        # Yields the issues of every page, as the pages arrive
+        nonlocal found_issues
+        for issues_rest in iter_search_pages(url
+                                             ,authenticate
+                                             ,config.page_size
+                                             ,config.prefetch_pages
+                                             ,config.stream_json):
+            found_issues = True
+            issues = issues_rest['issues']
+            if config.stream_json:
+                fstr = "{0}Streaming {1} issues ({2} of {3})..."
+                print(fstr.format(NOTE_LABEL
+                                  ,proj_key
+                                  ,issues_rest.get('startAt', 0)
+                                  ,issues_rest.get('total', 0)))
+            else:
+                fstr = "{0}Retrieved {1} {2} issues ({3} of {4})..."
+                print(fstr.format(NOTE_LABEL
+                                  ,len(issues)
+                                  ,proj_key
+                                  ,issues_rest.get('startAt', 0)
+                                  ,issues_rest.get('total', 0)))
+            # There should be a more elegant way of doing this, but the
+            # REST API apparently doesn't have a way to query for its
+            # own version
+            if alpha1:
+                issues = adapt_2alpha1_issues(issues
+                                              ,config
+                                              ,authenticate
+                                              ,counters
+                                              ,user_cache
+                                              ,executor
+                                              ,meter)
+            elif not config.stream_json and pool is None:
+                # (pool workers count each shard's requirements themselves)
+                prime_requirement_cnts(issues, config.issues_with_requirements)
+            for i in issues:
+                if i is not None:
+                    yield i
+                else:
+                    err_str = "{0}Bad Issue Reference\n"
+                    sys.stderr.write(err_str.format(ERR_LABEL))
+
+    try:
+        if MEASUREMENTS_OUT:
+            proc_issues(project_issues(), config, counters, pool)
+        else:
+            for i in project_issues():
+                dump_issue(i, config, counters)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if meter is not None:
+            meter.report()
+
+    return found_issues
+
+
+def sync_project(proj_key, config, authenticate, store):
+    """Brings a project's stored issues up to date
+
+    The first sync retrieves every issue.  Later syncs only ask for issues
+    updated since the watermark, using a relative JQL date so the query
+    doesn't depend on the server's time zone.  Each page is written to the
+    store as it arrives.  The watermark only advances when every page was
+    retrieved.  Every full_sync_hours, the sync retrieves every issue
+    again, and stored issues it didn't see (deleted in JIRA, or moved to
+    another project) are removed from the store.
+
+    Args:
+        proj_key - string containing the key of the project to sync
+        config - configuration object
+        authenticate - tuple containing username & password to log into JIRA
+        store - IssueStore object
+
+    Returns:
+        True if the server could be queried, False otherwise
+    """
+    sync_start = int(time.time() * 1000)
+    watermark = store.get_watermark(proj_key)
+    last_full = store.get_full_sync(proj_key)
+    full_sync = (watermark is None
+                 or last_full is None
+                 or sync_start - last_full >= config.full_sync_hours*3600000)
+    seen_keys = set()
+
+    def note_keys(issues):
+        # passes the issues through, remembering the keys a full sync saw
+        for i in issues:
+            seen_keys.add(i['key'])
+            yield i
+
+    jql = "project={0}".format(proj_key)
+    if not full_sync:
+        # minutes since the last sync, plus some overlap for clock skew
+        elapsed = (sync_start - watermark) // 60000 + 1
+        jql += ' AND updated>="-{0}m"'.format(elapsed + config.sync_overlap)
+    jql += " order by created asc"
+    query = "search?jql={0}&expand=changelog".format(urllib.parse.quote(jql))
+    url = "{0}{1}{2}".format(config.server, config.jira_rest_api, query)
+    print("\nSynchronizing project: {0}".format(proj_key))
+    print("Making Requests for: {0}".format(url))
+    queried = False
+    complete = False
+    merged = 0
+    for issues_rest in iter_search_pages(url
+                                         ,authenticate
+                                         ,config.page_size
+                                         ,config.prefetch_pages
+                                         ,config.stream_json):
+        queried = True
+        issues = issues_rest['issues']
+        merged += store.put_issues(note_keys(issues) if full_sync else issues)
+        if config.stream_json:
+            if issues.error is not None:
+                complete = False
+                break
+            received = issues.count
+        else:
+            received = len(issues)
+        complete = (issues_rest.get('startAt', 0) + received
+                    >= issues_rest.get('total', 0))
+    if complete:
+        store.set_watermark(proj_key, sync_start)
+        if full_sync:
+            removed = store.prune(proj_key, seen_keys)
+            store.set_full_sync(proj_key, sync_start)
+            if removed:
+                fstr = "{0}Removed {1} deleted or moved {2} issues from store"
+                print(fstr.format(NOTE_LABEL, removed, proj_key))
+    fstr = "{0}Stored {1} changed {2} issues, {3} issues in store"
+    print(fstr.format(NOTE_LABEL, merged, proj_key, store.count(proj_key)))
+    return queried
+
+
+def proc_project_stored(proj_key, config, authenticate, counters, pool=None):
+    """Processes a project's issues from the issue store
+
+    Unless running offline, the store is synchronized with the server
+    first.  The issues are then read back from the store, in order of
+    creation, and processed without any further requests.
+
+    Args:
+        proj_key - string containing the key of the project to process
+        config - configuration object
+        authenticate - tuple containing username & password to log into JIRA
+        counters - object containing occurrence counters
+        pool - process pool for proc_issues, or None
+
+    Returns:
+        True if the project has issues to process, False otherwise
+    """
+    # Each call gets its own connection, so projects can be processed by
+    # separate threads
+    with IssueStore(config.issue_store) as store:
+        queried = False
+        if not config.offline:
+            queried = sync_project(proj_key, config, authenticate, store)
+        found_issues = queried or store.count(proj_key) > 0
+        if MEASUREMENTS_OUT:
+            proc_issues(store.iter_issues(proj_key), config, counters, pool)
+        else:
+            for i in store.iter_issues(proj_key):
+                dump_issue(i, config, counters)
+    return found_issues
+
+
 def jira_main(config):
     """Main function for processing JIRA information
 
@@ -865,58 +1750,82 @@ def jira_main(config):
     api = config.jira_rest_api
     #
     # Get the list of projects.  We'll process issues for each project
-    proj_url = "{0}{1}project".format(server, api)
-    projects = get_rest(proj_url, authenticate)
+    if config.offline:
+        # Everything comes from the issue store
+        if not config.issue_store:
+            err_str = "{0}Running offline requires an issue_store.\n"
+            sys.stderr.write(err_str.format(ERR_LABEL))
+            return
+        projects = [{"key":key, "name":key}
+                    for key in config.projects_to_analyze]
+    else:
+        proj_url = "{0}{1}project".format(server, api)
+        projects = get_rest(proj_url, authenticate)
     print("{0}Found {1} projects.".format(NOTE_LABEL, len(projects)))
     proj_name2key_map = build_proj_name2key_map(projects)
+    project_keys = [proj['key'] for proj in projects
+                    if proj['key'] in config.projects_to_analyze]
+    # Shared by all projects, since the same users work across projects
+    user_cache = UserCache(config.user_cache_size, config.user_cache)
+    # Worker processes for proc_issue, also shared by all projects
+    pool = make_issue_pool(config)
     # flag will be set to True if we find any issues in the projects
     found_issues = False
-    for proj in projects:
-        if proj['key'] in config.projects_to_analyze:
-            query_str = ("search?jql=project={0}+order+by+created+asc"
-                         "&startAt=0&expand=changelog&maxResults=-1")
-            query = query_str.format(proj['key'])
-            url = "{0}{1}{2}".format(server, api, query)
-            print("\nProcessing project: {0}".format(proj['key']))
-            print("Making Request for: {0}".format(url))    
-            issues_rest = get_rest(url, authenticate)
-            if issues_rest is not None:
-                found_issues = True
-                fstr = "{0}Retrieved {1} issues..."
-                print(fstr.format(NOTE_LABEL, len(issues_rest['issues'])))
-                for i in issues_rest['issues']:
-                    # There should be a more elegant way of doing this, but the
-                    # REST API apparently doesn't have a way to query for its
-                    # own version
-                    if api == "rest/api/2.0.alpha1/":
-                        # obsolete version of the API, we'll need to adapt the
-                        # issue for processing by these functions
-                        i = adapt_2alpha1_issue(i
-                                                ,config
-                                                ,authenticate
-                                                ,counters
-                                                )
-                    # Current version of the API
-                    if i is not None:
-                        if MEASUREMENTS_OUT:
-                            proc_issue(i, config, counters)
-                        else:
-                            dump_issue(i, config, counters)
-                    else:
-                        err_str = "{0}Bad Issue Reference\n"
-                        sys.stderr.write(err_str.format(ERR_LABEL))
+    if config.project_workers > 1 and len(project_keys) > 1:
+        # Each project gets its own Counters; the results are merged in
+        # project order, so the output matches the serial run
+        def proc_isolated(proj_key):
+            proj_counters = Counters()
+            found = proc_project(proj_key
+                                 ,config
+                                 ,authenticate
+                                 ,proj_counters
+                                 ,user_cache
+                                 ,pool)
+            return found, proj_counters
+
+        try:
+            with ThreadPoolExecutor(max_workers=config.project_workers) as ex:
+                results = list(ex.map(proc_isolated, project_keys))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        for found, proj_counters in results:
+            found_issues = found_issues or found
+            counters.merge(proj_counters)
+    else:
+        try:
+            for proj_key in project_keys:
+                if proc_project(proj_key
+                                ,config
+                                ,authenticate
+                                ,counters
+                                ,user_cache
+                                ,pool):
+                    found_issues = True
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    if api == ALPHA1_API:
+        user_cache.save()
 
     if found_issues:
         # Take care of the sprints
         sprint_api = config.sprint_api
         # "rest/greenhopper/1.0/"
-        # If sprint_api isn't set in the configuration file, we'll skip
-        # this step
-        if sprint_api is not None:
+        # If sprint_api isn't set in the configuration file, or we're
+        # offline, we'll skip this step
+        if sprint_api is not None and not config.offline:
+            sprint_cache = None
+            if config.sprint_cache:
+                sprint_cache = SprintCache(config.sprint_cache)
             proc_sprints(server+sprint_api
                          ,proj_name2key_map
                          ,authenticate
                          ,counters
+                         ,config.fetch_workers
+                         ,sprint_cache
                          )
         # and the contributors
         handle_contributors(counters.contributors)
@@ -925,7 +1834,7 @@ def jira_main(config):
         if counters.measurements:
             # Measurements were placed on the list in order of issue
             # processing.  Re-order by sorting on timestamp
-            counters.measurements.sort(key=itemgetter(3))
+            counters.measurements.sort()
             if GLOBALS['VERBOSE']:
                 for i in counters.measurements:
                     print(i)
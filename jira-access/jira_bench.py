@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+"""jira_bench.py benchmarks the CPU bound stages of jira_access.py
+
+Generates a synthetic dataset with jira_synth.py, or loads one it wrote, and
+runs each stage of the issue processing path over it, reporting the time
+and peak memory of every stage:
+
+    parse_timestamp     - uncached conversion of every issue / history date
+    gen_timestamp       - the same conversions through the timestamp memo,
+                          which is warm after the first repeat
+    get_requirement_cnt - requirement counting of every description
+    proc_histories      - changelog walk of every issue
+    proc_issue          - complete processing of every issue
+    gen_json            - writing the resulting measurements
+
+Each stage is timed over several repeats and the best time is reported.
+Peak memory is measured with tracemalloc in a separate, untimed run, since
+tracing slows everything down.  The results can be saved, and compared with
+an earlier run to catch regressions: the script exits with status 1 when a
+stage is slower than the baseline by more than the tolerance.
+
+USAGE:  jira_bench.py [options]
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from grip_import import GLOBALS
+from grip_import import ERR_LABEL
+from grip_import import GripConfig
+from grip_import import gen_json
+from grip_import import gen_timestamp
+from grip_import import parse_timestamp
+from grip_import import get_requirement_cnt
+
+from jira_access import Counters
+from jira_access import RECORD_KEY
+from jira_access import proc_histories
+from jira_access import proc_issue
+import jira_synth
+
+
+def make_bench_config():
+    """Returns a configuration object matching the synthetic data"""
+    config = GripConfig()
+    config.defect_types = ["Bug"]
+    config.issues_with_requirements = ["Story"]
+    config.closed_status = [jira_synth.CLOSED]
+    return config
+
+
+def clear_records(issues):
+    """Drops the processing records, so every repeat starts from scratch"""
+    for i in issues:
+        i.pop(RECORD_KEY, None)
+
+
+class Stage(object):
+    """One benchmarked stage of the processing path
+
+    Args:
+        name - string with the stage's name
+        run - function doing the stage's work once; returns the number of
+              items it handled
+        setup - optional function called before each run, untimed
+    """
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self._run = run
+        self._setup = setup
+
+    def time(self, repeats):
+        """Returns the best time, in seconds, and the item count"""
+        best = None
+        items = 0
+        for _ in range(repeats):
+            if self._setup is not None:
+                self._setup()
+            start = time.perf_counter()
+            items = self._run()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, items
+
+    def peak_memory(self):
+        """Returns the peak memory, in bytes, allocated during one run"""
+        if self._setup is not None:
+            self._setup()
+        tracemalloc.start()
+        try:
+            self._run()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def make_stages(issues, config, out_dir):
+    """Builds the list of benchmark stages over a list of issues"""
+    dates = []
+    for i in issues:
+        dates.append(i['fields']['created'])
+        dates.extend(h['created'] for h in i['changelog']['histories'])
+    descriptions = [(i['fields']['description']
+                     ,i['fields']['issuetype']['name']) for i in issues]
+    # proc_issue's measurements are kept for the gen_json stage
+    results = {"counters":Counters()}
+
+    def run_parse_timestamp():
+        for d in dates:
+            parse_timestamp(d)
+        return len(dates)
+
+    def run_gen_timestamp():
+        for d in dates:
+            gen_timestamp(d)
+        return len(dates)
+
+    def run_requirement_cnt():
+        reqs = config.issues_with_requirements
+        for descr, issue_type in descriptions:
+            get_requirement_cnt(descr, reqs, issue_type)
+        return len(descriptions)
+
+    def run_proc_histories():
+        counters = Counters()
+        for i in issues:
+            proc_histories(i, config, counters)
+        return len(issues)
+
+    def run_proc_issue():
+        counters = Counters()
+        for i in issues:
+            proc_issue(i, config, counters)
+        counters.measurements.sort()
+        results['counters'] = counters
+        return len(issues)
+
+    def run_gen_json():
+        measurements = results['counters'].measurements
+        gen_json(measurements, os.path.join(out_dir, "bench"))
+        for name in os.listdir(out_dir):
+            os.remove(os.path.join(out_dir, name))
+        return len(measurements)
+
+    return [Stage("parse_timestamp", run_parse_timestamp)
+            ,Stage("gen_timestamp", run_gen_timestamp)
+            ,Stage("get_requirement_cnt", run_requirement_cnt)
+            ,Stage("proc_histories"
+                   ,run_proc_histories
+                   ,lambda: clear_records(issues))
+            ,Stage("proc_issue", run_proc_issue, lambda: clear_records(issues))
+            ,Stage("gen_json", run_gen_json)
+            ]
+
+
+def bench_main(issues, repeats, measure_memory=True):
+    """Runs the benchmark stages and prints a results table
+
+    Args:
+        issues - list of issue dictionaries
+        repeats - number of timed repetitions of each stage
+        measure_memory - if True, measure each stage's peak memory
+
+    Returns:
+        Dictionary mapping each stage name to a dictionary with its 'items',
+        best 'seconds', 'items_per_sec' and 'peak_bytes'
+    """
+    config = make_bench_config()
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        # verbose output from the processing would swamp the table
+        verbose = GLOBALS['VERBOSE']
+        GLOBALS['VERBOSE'] = False
+        print("\n{0:<20} {1:>9} {2:>10} {3:>12} {4:>11}".format(
+            "stage", "items", "seconds", "items/sec", "peak KiB"))
+        try:
+            for stage in make_stages(issues, config, out_dir):
+                seconds, items = stage.time(repeats)
+                peak = stage.peak_memory() if measure_memory else 0
+                rate = items / seconds if seconds else 0.0
+                results[stage.name] = {"items":items
+                                       ,"seconds":seconds
+                                       ,"items_per_sec":rate
+                                       ,"peak_bytes":peak
+                                       }
+                print("{0:<20} {1:>9} {2:>10.4f} {3:>12.0f} {4:>11.0f}".format(
+                    stage.name, items, seconds, rate, peak / 1024.0))
+        finally:
+            GLOBALS['VERBOSE'] = verbose
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """Compares results with a baseline run
+
+    Args:
+        results - dictionary returned by bench_main
+        baseline - dictionary returned by bench_main for an earlier run
+        tolerance - allowed slowdown, as a fraction (0.1 is 10%)
+
+    Returns:
+        List of the names of the stages that regressed
+    """
+    regressed = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base['items_per_sec']:
+            continue
+        ratio = result['items_per_sec'] / base['items_per_sec']
+        flag = ""
+        if ratio < 1.0 - tolerance:
+            regressed.append(name)
+            flag = "  <-- REGRESSION"
+        print("{0:<20} {1:>6.2f}x baseline{2}".format(name, ratio, flag))
+    return regressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the jira_access processing stages")
+    parser.add_argument("--dataset"
+                        ,help="dataset file written by jira_synth.py; "
+                              "generated from the options below otherwise")
+    jira_synth.add_spec_args(parser)
+    parser.add_argument("--repeats", type=int, default=3
+                        ,help="timed repetitions per stage")
+    parser.add_argument("--no-memory", action="store_true"
+                        ,help="skip the peak memory measurements")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline"
+                        ,help="compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10
+                        ,help="allowed slowdown against the baseline "
+                              "(default 0.10)")
+    args = parser.parse_args()
+
+    GLOBALS['ACCOUNT_NAME'] = "bench"
+    if args.dataset:
+        dataset = jira_synth.load_dataset(args.dataset)
+    else:
+        dataset = jira_synth.make_dataset(jira_synth.spec_from_args(args))
+    issues = [i for proj in dataset['projects']
+              for i in dataset['issues'][proj['key']]]
+    print("Issues: {0}, histories: {1}".format(
+        len(issues), sum(len(i['changelog']['histories']) for i in issues)))
+
+    results = bench_main(issues, args.repeats, not args.no_memory)
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        print("")
+        if compare_results(results, baseline, args.tolerance):
+            print("{0}Slower than the baseline".format(ERR_LABEL))
+            sys.exit(1)
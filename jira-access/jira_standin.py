@@ -0,0 +1,545 @@
+#!/usr/bin/python3
+"""jira_standin.py is a local stand-in for a JIRA server
+
+Serves the REST endpoints used by jira_access.py from a dataset, so the
+whole fetch path can be exercised and benchmarked without a live JIRA:
+
+    rest/api/2/project
+    rest/api/2/search                (jql project / updated, real startAt
+                                      and maxResults pagination)
+    rest/api/2/issuetype, status, priority, resolution
+    rest/greenhopper/1.0/rapidviews/list
+    rest/greenhopper/1.0/sprintquery/<rapidViewId>
+    rest/greenhopper/1.0/rapid/charts/scopechangeburndownchart.json
+
+The dataset is either generated with jira_synth.py, or recorded from a real
+server with --record.  Every response can be delayed by a fixed latency,
+sent at a limited bandwidth, or, at a given rate, replaced by a 429 (Too
+Many Requests) with a Retry-After header.  Request counts are printed when
+the server stops, and served as JSON at /_standin/stats.
+
+With --run, the stand-in is started in the background and jira_main is run
+against it, reporting the elapsed time and request throughput.  Settings
+given with --set (e.g. --set prefetch_pages=4) are applied to the run's
+configuration, so fetch and concurrency settings can be compared
+reproducibly.
+
+USAGE:  jira_standin.py [options]
+
+Module External Functions:
+    make_server - create the stand-in HTTP server for a dataset
+    start_server - create the server and serve it from a daemon thread
+    record_dataset - record a dataset from a real JIRA server
+
+Module Classes:
+    StandinOptions - namedtuple with the stand-in's behaviour settings
+    JiraStandin - routes requests to responses built from the dataset
+    StandinHandler - HTTP request handler for the stand-in
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import urllib.parse
+from collections import Counter
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from grip_import import GLOBALS
+from grip_import import ERR_LABEL
+from grip_import import NOTE_LABEL
+from grip_import import GripConfig
+from grip_import import gen_timestamp
+from grip_import import get_rest
+
+import jira_synth
+
+
+# Behaviour of the stand-in
+#   api - path of the JIRA REST API
+#   sprint_api - path of the greenhopper (sprint) API
+#   max_results - most issues returned per search page, whatever the
+#                 maxResults asked for
+#   latency - seconds every response is delayed
+#   bandwidth - bytes per second each response is sent at; 0 is unlimited
+#   rate_429 - share of the requests answered with 429 Too Many Requests
+#   retry_after - seconds given in the Retry-After header of a 429
+#   seed - random seed for the 429 injection
+StandinOptions = namedtuple('StandinOptions'
+                            ,['api'
+                              ,'sprint_api'
+                              ,'max_results'
+                              ,'latency'
+                              ,'bandwidth'
+                              ,'rate_429'
+                              ,'retry_after'
+                              ,'seed'
+                              ])
+StandinOptions.__new__.__defaults__ = ("rest/api/2/"
+                                       ,"rest/greenhopper/1.0/"
+                                       ,100
+                                       ,0.0
+                                       ,0
+                                       ,0.0
+                                       ,0
+                                       ,1)
+
+# Bytes written at a time when the bandwidth is limited
+THROTTLE_CHUNK = 16*1024
+
+_JQL_PROJECT = re.compile(r'project\s*=\s*"?([A-Za-z0-9_\-]+)')
+_JQL_UPDATED = re.compile(r'updated\s*>=\s*"?-(\d+)m')
+
+_DESCRIPTIONS = {"issuetype":["Bug", "Story", "Task"]
+                 ,"status":jira_synth.WORKFLOW + [jira_synth.CLOSED]
+                 ,"priority":["Minor", "Major", "Critical"]
+                 ,"resolution":["Fixed", "Won't Fix", "Duplicate"]
+                 }
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class JiraStandin(object):
+    """Routes requests to responses built from a dataset
+
+    The issues are encoded once, up front, so building a search page only
+    joins pre-encoded issues and the stand-in isn't the bottleneck of a
+    benchmark.
+
+    Args:
+        dataset - dictionary as built by jira_synth.make_dataset
+        options - StandinOptions
+    """
+    def __init__(self, dataset, options):
+        self.options = options
+        self._rnd = random.Random(options.seed)
+        self._lock = threading.Lock()
+        self.stats = Counter()
+        self._projects = dataset['projects']
+        self._issues = {}
+        self._updated = {}
+        for proj in self._projects:
+            issues = dataset['issues'].get(proj['key'], [])
+            self._issues[proj['key']] = [_encode(i) for i in issues]
+            self._updated[proj['key']] = [
+                gen_timestamp(i['fields'].get('updated')
+                              or i['fields']['created'])
+                for i in issues]
+        self._views = {proj['view_id']: proj for proj in self._projects}
+        self._sprints = {}
+        for proj in self._projects:
+            for sprint in dataset.get('sprints', {}).get(proj['key'], []):
+                self._sprints[(proj['view_id'], sprint['id'])] = sprint
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def inject_429(self):
+        """True if this request should get a 429"""
+        if self.options.rate_429 <= 0:
+            return False
+        with self._lock:
+            return self._rnd.random() < self.options.rate_429
+
+    def route(self, path, query):
+        """Builds the response for a GET
+
+        Args:
+            path - string with the request path, without the leading /
+            query - dictionary of the query parameters
+
+        Returns:
+            Tuple of the status code and the body (bytes)
+        """
+        api = self.options.api
+        sprint_api = self.options.sprint_api
+        if path == "_standin/stats":
+            return 200, _encode(dict(self.stats))
+        if path.startswith(api):
+            endpoint = path[len(api):]
+            if endpoint == "project":
+                return 200, _encode([{"key":p['key']
+                                      ,"name":p['name']
+                                      ,"id":str(p['view_id'])}
+                                     for p in self._projects])
+            if endpoint == "search":
+                return self.search(query)
+            if endpoint in _DESCRIPTIONS:
+                return 200, _encode([{"name":n, "description":n}
+                                     for n in _DESCRIPTIONS[endpoint]])
+        elif path.startswith(sprint_api):
+            endpoint = path[len(sprint_api):]
+            if endpoint == "rapidviews/list":
+                return 200, _encode({"views":[{"id":p['view_id']
+                                               ,"name":p['name']}
+                                              for p in self._projects]})
+            if endpoint.startswith("sprintquery/"):
+                return self.sprintquery(endpoint[len("sprintquery/"):])
+            if endpoint == "rapid/charts/scopechangeburndownchart.json":
+                return self.burndown(query)
+        return 404, _encode({"errorMessages":["Not found: " + path]})
+
+    def search(self, query):
+        jql = query.get('jql', "")
+        fnd = _JQL_PROJECT.search(jql)
+        if fnd is None or fnd.group(1) not in self._issues:
+            return 400, _encode({"errorMessages":["Bad jql: " + jql]})
+        key = fnd.group(1)
+        encoded = self._issues[key]
+        fnd = _JQL_UPDATED.search(jql)
+        if fnd is not None:
+            since = int(time.time() * 1000) - int(fnd.group(1)) * 60000
+            encoded = [e for e, updated in zip(encoded, self._updated[key])
+                       if updated >= since]
+        start_at = max(0, int(query.get('startAt', 0)))
+        max_results = min(int(query.get('maxResults', 50))
+                          ,self.options.max_results)
+        page = encoded[start_at:start_at + max_results]
+        header = ('{{"expand":"schema,names","startAt":{0},"maxResults":{1},'
+                  '"total":{2},"issues":['.format(start_at
+                                                  ,max_results
+                                                  ,len(encoded)))
+        self.count("issues", len(page))
+        return 200, header.encode('ascii') + b",".join(page) + b"]}"
+
+    def sprintquery(self, view_str):
+        try:
+            view = self._views[int(view_str)]
+        except (ValueError, KeyError):
+            return 404, _encode({"errorMessages":["No view: " + view_str]})
+        sprints = [{"id":s['id'], "name":s['name'], "state":s['state']}
+                   for (view_id, _), s in self._sprints.items()
+                   if view_id == view['view_id']]
+        return 200, _encode({"rapidViewId":view['view_id']
+                             ,"sprints":sprints})
+
+    def burndown(self, query):
+        try:
+            sprint = self._sprints[(int(query['rapidViewId'])
+                                    ,int(query['sprintId']))]
+        except (ValueError, KeyError):
+            return 404, _encode({"errorMessages":["No such sprint"]})
+        return 200, _encode({"changes":{}
+                             ,"startTime":sprint['startTime']
+                             ,"endTime":sprint['endTime']
+                             ,"now":int(time.time() * 1000)
+                             })
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """HTTP request handler for the stand-in
+
+    Speaks HTTP/1.1 with a Content-Length on every response, so clients
+    can keep their connections alive.  Nagle's algorithm is off, since the
+    headers and body are separate writes, and the client's delayed ACK
+    would otherwise hold up every response on a kept-alive connection.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if GLOBALS['VERBOSE']:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        standin = self.server.standin
+        options = standin.options
+        parsed = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        path = parsed.path.lstrip("/")
+        standin.count("requests")
+        if options.latency > 0:
+            time.sleep(options.latency)
+        if not path.startswith("_standin/") and standin.inject_429():
+            standin.count("429")
+            self.send_response(429)
+            self.send_header("Retry-After", str(options.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status, body = standin.route(path, query)
+        standin.count(status)
+        standin.count("bytes", len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.send_body(body, options.bandwidth)
+
+    def send_body(self, body, bandwidth):
+        if bandwidth <= 0:
+            self.wfile.write(body)
+            return
+        start = time.perf_counter()
+        sent = 0
+        view = memoryview(body)
+        while sent < len(body):
+            chunk = view[sent:sent + THROTTLE_CHUNK]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            ahead = sent / bandwidth - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def make_server(dataset, options=None, host="127.0.0.1", port=0):
+    """Creates the stand-in HTTP server for a dataset
+
+    Args:
+        dataset - dictionary as built by jira_synth.make_dataset
+        options - StandinOptions; defaults if None
+        host - string with the address to listen on
+        port - port to listen on; 0 picks a free port
+
+    Returns:
+        ThreadingHTTPServer, with the JiraStandin as its standin attribute.
+        Its base URL is http://host:server.server_port/
+    """
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.standin = JiraStandin(dataset, options or StandinOptions())
+    return server
+
+
+def start_server(dataset, options=None, host="127.0.0.1", port=0):
+    """Creates the stand-in server and serves it from a daemon thread
+
+    Returns:
+        The running server; call its shutdown method to stop it
+    """
+    server = make_server(dataset, options, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def record_dataset(config, authenticate):
+    """Records a dataset from a real JIRA server
+
+    Fetches the configured projects' issues, with their changelogs, and,
+    if the configuration has a sprint_api, the rapid views, sprints and
+    burndown start / end times, in the jira_synth dataset format.
+
+    Args:
+        config - configuration object
+        authenticate - tuple containing username & password to log into JIRA
+
+    Returns:
+        The dataset dictionary, or None if the projects can't be retrieved
+    """
+    from jira_access import iter_search_pages
+
+    base = config.server + config.jira_rest_api
+    projects = get_rest(base + "project", authenticate)
+    if projects is None:
+        return None
+    views = {}
+    if config.sprint_api:
+        views_rest = get_rest(config.server + config.sprint_api
+                              + "rapidviews/list", authenticate) or {}
+        views = {v['name']: v['id'] for v in views_rest.get('views', [])}
+    dataset = {"projects":[], "issues":{}, "sprints":{}}
+    for idx, proj in enumerate(projects):
+        if proj['key'] not in config.projects_to_analyze:
+            continue
+        view_id = views.get(proj['name'], -(idx + 1))
+        dataset['projects'].append({"key":proj['key']
+                                    ,"name":proj['name']
+                                    ,"view_id":view_id})
+        jql = "project={0} order by created asc".format(proj['key'])
+        url = "{0}search?jql={1}&expand=changelog".format(
+            base, urllib.parse.quote(jql))
+        issues = []
+        for page in iter_search_pages(url, authenticate, config.page_size):
+            issues.extend(page['issues'])
+        dataset['issues'][proj['key']] = issues
+        print("{0}Recorded {1} {2} issues".format(NOTE_LABEL
+                                                  ,len(issues)
+                                                  ,proj['key']))
+        sprints = []
+        if view_id > 0:
+            sprint_api = config.server + config.sprint_api
+            query = get_rest("{0}sprintquery/{1}?includeHistoricSprints=true"
+                             .format(sprint_api, view_id), authenticate) or {}
+            for s in query.get('sprints', []):
+                chart = get_rest(
+                    "{0}rapid/charts/scopechangeburndownchart.json?"
+                    "rapidViewId={1}&sprintId={2}".format(sprint_api
+                                                          ,view_id
+                                                          ,s['id'])
+                    ,authenticate) or {}
+                sprints.append({"id":s['id']
+                                ,"name":s.get('name', str(s['id']))
+                                ,"state":s.get('state')
+                                ,"startTime":chart.get('startTime')
+                                ,"endTime":chart.get('endTime')})
+        dataset['sprints'][proj['key']] = sprints
+    return dataset
+
+
+def parse_setting(text):
+    """Parses a --set key=value pair; values are JSON, or plain strings"""
+    key, _, value = text.partition("=")
+    try:
+        return key.strip(), json.loads(value)
+    except ValueError:
+        return key.strip(), value
+
+
+def run_jira_main(server, dataset, settings):
+    """Runs jira_main against a running stand-in and reports throughput
+
+    Args:
+        server - server returned by start_server
+        dataset - the dataset the server is serving
+        settings - list of (attribute, value) configuration overrides
+
+    Returns:
+        No return value
+    """
+    import jira_access
+
+    standin = server.standin
+    config = GripConfig()
+    config.account_name = "standin"
+    config.server = "http://127.0.0.1:{0}/".format(server.server_port)
+    config.jira_rest_api = standin.options.api
+    config.sprint_api = standin.options.sprint_api
+    config.username = "standin"
+    config.password = "standin"
+    config.projects_to_analyze = [p['key'] for p in dataset['projects']]
+    config.defect_types = ["Bug"]
+    config.issues_with_requirements = ["Story"]
+    config.closed_status = [jira_synth.CLOSED]
+    config.verbose = False
+    for attr, value in settings:
+        setattr(config, attr, value)
+    GLOBALS['ACCOUNT_NAME'] = config.account_name
+    out_dir = tempfile.TemporaryDirectory()
+    if not getattr(config, 'json_basename', None):
+        config.json_basename = out_dir.name + "/standin"
+    with out_dir:
+        start = time.perf_counter()
+        jira_access.jira_main(config)
+        elapsed = time.perf_counter() - start
+    stats = standin.stats
+    fstr = ("\nElapsed:   {0:.2f}s\n"
+            "Requests:  {1} ({2:.1f}/sec), {3} answered 429\n"
+            "Issues:    {4} ({5:.0f}/sec)\n"
+            "Bytes:     {6} ({7:.2f} MB/sec)\n")
+    print(fstr.format(elapsed
+                      ,stats['requests']
+                      ,stats['requests'] / elapsed
+                      ,stats['429']
+                      ,stats['issues']
+                      ,stats['issues'] / elapsed
+                      ,stats['bytes']
+                      ,stats['bytes'] / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve a JIRA dataset for end-to-end benchmarks")
+    parser.add_argument("--dataset"
+                        ,help="dataset file from jira_synth.py or --record; "
+                              "generated from the options below otherwise")
+    jira_synth.add_spec_args(parser)
+    defaults = StandinOptions()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-results", type=int
+                        ,default=defaults.max_results
+                        ,help="most issues per search page")
+    parser.add_argument("--latency", type=float, default=defaults.latency
+                        ,help="seconds each response is delayed")
+    parser.add_argument("--bandwidth", type=float, default=defaults.bandwidth
+                        ,help="bytes/sec per response; 0 is unlimited")
+    parser.add_argument("--rate-429", type=float, default=defaults.rate_429
+                        ,help="share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int
+                        ,default=defaults.retry_after
+                        ,help="Retry-After seconds sent with a 429")
+    parser.add_argument("--record", metavar="CFG_BASENAME"
+                        ,help="record the dataset from the JIRA server in "
+                              "CFG_BASENAME.cfg into --dataset, and exit")
+    parser.add_argument("--run", action="store_true"
+                        ,help="run jira_main against the stand-in, report "
+                              "the throughput, and exit")
+    parser.add_argument("--set", action="append", default=[]
+                        ,metavar="KEY=VALUE"
+                        ,help="configuration setting for --run")
+    args = parser.parse_args()
+
+    if args.record:
+        from jira_access import get_config
+        if not args.dataset:
+            parser.error("--record needs --dataset")
+        config = get_config(args.record + ".cfg")
+        if config is None:
+            sys.exit(1)
+        dataset = record_dataset(config, (config.username, config.password))
+        if dataset is None:
+            print("{0}Unable to record the dataset".format(ERR_LABEL))
+            sys.exit(1)
+        jira_synth.save_dataset(dataset, args.dataset)
+        sys.exit(0)
+
+    if args.dataset:
+        dataset = jira_synth.load_dataset(args.dataset)
+    else:
+        dataset = jira_synth.make_dataset(jira_synth.spec_from_args(args))
+    options = StandinOptions(max_results=args.max_results
+                             ,latency=args.latency
+                             ,bandwidth=args.bandwidth
+                             ,rate_429=args.rate_429
+                             ,retry_after=args.retry_after
+                             ,seed=args.seed)
+    if args.run:
+        server = start_server(dataset, options, args.host, 0)
+        try:
+            run_jira_main(server, dataset, [parse_setting(s) for s in args.set])
+        finally:
+            server.shutdown()
+        sys.exit(0)
+
+    server = make_server(dataset, options, args.host, args.port)
+    print("{0}Serving {1} projects at http://{2}:{3}/".format(
+        NOTE_LABEL, len(dataset['projects']), args.host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\n{0}Requests served: {1}".format(
+            NOTE_LABEL, dict(server.standin.stats)))
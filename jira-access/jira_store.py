@@ -0,0 +1,255 @@
+"""jira_store.py keeps a local SQLite copy of the issues retrieved from JIRA
+
+Issues and their changelog histories are stored in an SQLite database,
+indexed by issue key, project and updated date, so that the issues can be
+synchronized incrementally and processed again without downloading them.
+Writes are batched into transactions.
+
+Module Classes:
+    IssueStore - SQLite store of issues, changelog histories and per-project
+                 sync watermarks / full sync times
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import json
+import sqlite3
+from itertools import islice
+
+from grip_import import gen_timestamp
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    key TEXT PRIMARY KEY
+    ,project TEXT NOT NULL
+    ,created INTEGER NOT NULL
+    ,updated INTEGER
+    ,data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_project_created
+    ON issues (project, created);
+CREATE INDEX IF NOT EXISTS issues_updated ON issues (updated);
+CREATE TABLE IF NOT EXISTS histories (
+    issue_key TEXT NOT NULL
+    ,seq INTEGER NOT NULL
+    ,created INTEGER
+    ,data TEXT NOT NULL
+    ,PRIMARY KEY (issue_key, seq)
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    project TEXT PRIMARY KEY
+    ,watermark INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS full_syncs (
+    project TEXT PRIMARY KEY
+    ,synced INTEGER NOT NULL
+);
+"""
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+class IssueStore(object):
+    """SQLite store of JIRA issues and their changelog histories
+
+    Each issue is stored without its changelog histories, which go into a
+    separate table, one row per history record.  Issues are read back with
+    their histories re-attached, in the same form as returned by the search
+    API, so proc_issue can run straight from the store.
+
+    Args:
+        path - string containing the path of the database file
+        batch_size - number of issues written per transaction
+    """
+    def __init__(self, path, batch_size=500):
+        self._batch_size = batch_size
+        # Writers in other threads / processes may hold the lock for the
+        # length of a batch, so wait for them rather than failing
+        self._conn = sqlite3.connect(path, timeout=60.0)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put_issues(self, issues):
+        """Inserts new issues and replaces changed ones
+
+        Args:
+            issues - iterable of issue dictionaries, as returned by the
+                     search API with expand=changelog
+
+        Returns:
+            Number of issues written
+        """
+        written = 0
+        issues = iter(issues)
+        while True:
+            batch = list(islice(issues, self._batch_size))
+            if not batch:
+                break
+            self._put_batch(batch)
+            written += len(batch)
+        return written
+
+    def _put_batch(self, batch):
+        issue_rows = []
+        history_rows = []
+        for issue in batch:
+            fields = issue['fields']
+            changelog = issue.get('changelog', {})
+            histories = changelog.get('histories', [])
+            # Store the issue without its histories; they get their own rows
+            stripped = dict(issue)
+            stripped['changelog'] = {k: v for k, v in changelog.items()
+                                     if k != 'histories'}
+            updated = fields.get('updated')
+            issue_rows.append((issue['key']
+                               ,fields['project']['key']
+                               ,gen_timestamp(fields['created'])
+                               ,gen_timestamp(updated) if updated else None
+                               ,_encode(stripped)))
+            for seq, hist in enumerate(histories):
+                created = hist.get('created')
+                history_rows.append((issue['key']
+                                     ,seq
+                                     ,gen_timestamp(created) if created else None
+                                     ,_encode(hist)))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO issues "
+                "(key, project, created, updated, data) "
+                "VALUES (?, ?, ?, ?, ?)", issue_rows)
+            self._conn.executemany(
+                "DELETE FROM histories WHERE issue_key = ?"
+                ,[(row[0],) for row in issue_rows])
+            self._conn.executemany(
+                "INSERT INTO histories (issue_key, seq, created, data) "
+                "VALUES (?, ?, ?, ?)", history_rows)
+
+    def iter_issues(self, project):
+        """Generator yielding a project's issues in order of creation
+
+        Issues are read one at a time, with their changelog histories
+        re-attached.  The histories come from a second query, in the same
+        issue order, so each issue's records are next to each other and are
+        picked up as the issues are read, rather than queried per issue.
+
+        Args:
+            project - string containing the project key
+
+        Returns:
+            Yields issue dictionaries
+        """
+        cursor = self._conn.execute(
+            "SELECT key, data FROM issues WHERE project = ? "
+            "ORDER BY created, rowid", (project,))
+        hist_cursor = self._conn.execute(
+            "SELECT h.issue_key, h.data FROM issues AS i "
+            "JOIN histories AS h ON h.issue_key = i.key "
+            "WHERE i.project = ? "
+            "ORDER BY i.created, i.rowid, h.seq", (project,))
+        hist_row = next(hist_cursor, None)
+        for key, data in cursor:
+            issue = json.loads(data)
+            histories = []
+            while hist_row is not None and hist_row[0] == key:
+                histories.append(json.loads(hist_row[1]))
+                hist_row = next(hist_cursor, None)
+            issue.setdefault('changelog', {})['histories'] = histories
+            yield issue
+
+    def count(self, project):
+        """Returns the number of issues stored for a project"""
+        row = self._conn.execute("SELECT COUNT(*) FROM issues "
+                                 "WHERE project = ?", (project,)).fetchone()
+        return row[0]
+
+    def projects(self):
+        """Returns the keys of the projects with stored issues"""
+        cursor = self._conn.execute("SELECT DISTINCT project FROM issues "
+                                    "ORDER BY project")
+        return [row[0] for row in cursor]
+
+    def get_watermark(self, project):
+        """Returns the project's sync watermark (milliseconds), or None"""
+        row = self._conn.execute("SELECT watermark FROM watermarks "
+                                 "WHERE project = ?", (project,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_watermark(self, project, watermark):
+        """Records the project's sync watermark (milliseconds)"""
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO watermarks "
+                               "(project, watermark) VALUES (?, ?)"
+                               ,(project, watermark))
+
+    def get_full_sync(self, project):
+        """Returns the time (milliseconds) of the project's last full sync,
+        or None"""
+        row = self._conn.execute("SELECT synced FROM full_syncs "
+                                 "WHERE project = ?", (project,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_full_sync(self, project, synced):
+        """Records the time (milliseconds) of the project's last full sync"""
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO full_syncs "
+                               "(project, synced) VALUES (?, ?)"
+                               ,(project, synced))
+
+    def prune(self, project, keys):
+        """Deletes the project's issues whose keys aren't in keys
+
+        Used after a full sync, to drop issues that were deleted from JIRA
+        or moved to another project.
+
+        Args:
+            project - string containing the project key
+            keys - iterable of the keys of the project's current issues
+
+        Returns:
+            Number of issues deleted
+        """
+        with self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_keys "
+                               "(key TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM current_keys")
+            self._conn.executemany("INSERT OR IGNORE INTO current_keys (key) "
+                                   "VALUES (?)", ((k,) for k in keys))
+            stale = ("SELECT key FROM issues WHERE project = ? "
+                     "AND key NOT IN (SELECT key FROM current_keys)")
+            self._conn.execute("DELETE FROM histories WHERE issue_key IN "
+                               "(" + stale + ")", (project,))
+            deleted = self._conn.execute("DELETE FROM issues WHERE key IN "
+                                         "(" + stale + ")"
+                                         ,(project,)).rowcount
+            self._conn.execute("DELETE FROM current_keys")
+        return deleted
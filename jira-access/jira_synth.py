@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+"""jira_synth.py generates synthetic JIRA search data
+
+Builds projects full of realistic looking issues, in the form returned by
+the JIRA REST API (Version 2) search with expand=changelog: creators and
+reporters, descriptions with bulleted / numbered requirement lines, and
+changelog histories that move the issues through their workflow.  The
+number of issues, the depth of the changelogs, the size of the descriptions
+and the share of defects are all configurable, and the output for a given
+seed is always the same.
+
+The data is used by jira_bench.py to benchmark the processing path, and can
+be written to a dataset file that jira_standin.py serves.
+
+USAGE:  jira_synth.py [options] dataset_file
+
+Module External Functions:
+    make_dataset - build a dataset of synthetic projects and issues
+    make_issue - build a single synthetic issue
+    make_search_page - wrap a slice of a project's issues as a search result
+    save_dataset - write a dataset to a (optionally gzipped) JSON file
+    load_dataset - read a dataset written by save_dataset
+
+Module Classes:
+    DatasetSpec - namedtuple with the parameters of a synthetic dataset
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import json
+import gzip
+import random
+import argparse
+import datetime
+from collections import namedtuple
+
+from grip_import import NOTE_LABEL
+
+
+# Parameters of a synthetic dataset
+#   projects - number of projects
+#   issues - number of issues per project
+#   histories - average number of changelog histories per issue
+#   description_lines - average number of lines per description
+#   defect_ratio - share of the issues that are defects (type Bug)
+#   story_ratio - share of the issues that are stories, which carry
+#                 requirements; the rest are tasks
+#   closed_ratio - share of the issues that end up closed
+#   contributors - number of distinct people working on the issues
+#   sprints - number of sprints per project (sprint API data)
+#   seed - random seed
+DatasetSpec = namedtuple('DatasetSpec'
+                         ,['projects'
+                           ,'issues'
+                           ,'histories'
+                           ,'description_lines'
+                           ,'defect_ratio'
+                           ,'story_ratio'
+                           ,'closed_ratio'
+                           ,'contributors'
+                           ,'sprints'
+                           ,'seed'
+                           ])
+DatasetSpec.__new__.__defaults__ = (1, 1000, 4, 8, 0.3, 0.4, 0.6, 50, 10, 1)
+
+
+# The first issue of every project is created at this time
+BASE_TIME = datetime.datetime(2015, 1, 5, 9, 0, 0)
+
+# Workflow states an issue moves through before it's closed
+WORKFLOW = ["Open", "In Progress", "In Review", "Resolved"]
+CLOSED = "Closed"
+
+WORDS = ("the a user can should must when with report page login button "
+         "error data field value list search export import update delete "
+         "project sprint build release server client cache timeout retry "
+         "display save load fails works slow fast expected actual").split()
+
+# Prefixes of the description lines that count as requirements
+REQUIREMENT_PREFIXES = ["- ", "* ", "# ", "1. ", "2) "]
+
+OTHER_FIELDS = ["assignee", "priority", "summary", "labels", "Fix Version"]
+
+
+def jira_datetime(when):
+    """Formats a datetime the way JIRA does: 2015-01-05T09:00:00.000+0000"""
+    return "{0}.{1:03d}+0000".format(when.strftime("%Y-%m-%dT%H:%M:%S")
+                                     ,when.microsecond // 1000)
+
+
+def make_person(idx):
+    """Returns the user structure for contributor number idx"""
+    return {"name":"user{0}".format(idx)
+            ,"displayName":"User {0}".format(idx)
+            ,"emailAddress":"user{0}@example.com".format(idx)
+            ,"active":True
+            }
+
+
+def make_sentence(rnd, min_words=4, max_words=12):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(min_words
+                                                          ,max_words))]
+    return " ".join(words).capitalize()
+
+
+def make_description(rnd, lines, with_requirements):
+    """Builds a description of about the given number of lines
+
+    Stories get a block of requirement lines amongst the prose; for other
+    issues the description is prose, occasionally with an indented line.
+    """
+    if lines <= 0:
+        return None
+    out = []
+    for _ in range(max(1, int(rnd.expovariate(1.0 / lines)))):
+        if with_requirements and rnd.random() < 0.4:
+            prefix = rnd.choice(REQUIREMENT_PREFIXES)
+            indent = " " * rnd.choice([0, 0, 2])
+            out.append(indent + prefix + make_sentence(rnd))
+        else:
+            out.append(make_sentence(rnd, 6, 20) + ".")
+    return "\n".join(out)
+
+
+def make_histories(rnd, spec, created, closed):
+    """Builds the changelog histories of an issue
+
+    Returns:
+        Tuple of the list of histories and the datetime of the last change
+    """
+    count = int(rnd.expovariate(1.0 / spec.histories)) if spec.histories else 0
+    if closed:
+        count = max(count, 1)
+    histories = []
+    when = created
+    state = 0
+    status = WORKFLOW[0]
+    for n in range(count):
+        when += datetime.timedelta(minutes=rnd.randint(5, 3*24*60))
+        last = (n == count - 1)
+        items = []
+        if last and closed:
+            items.append({"field":"status"
+                          ,"fieldtype":"jira"
+                          ,"fromString":status
+                          ,"toString":CLOSED})
+            status = CLOSED
+        elif rnd.random() < 0.5:
+            # move along the workflow, sometimes back to the start
+            state = 0 if rnd.random() < 0.1 else min(state + 1
+                                                     ,len(WORKFLOW) - 1)
+            items.append({"field":"status"
+                          ,"fieldtype":"jira"
+                          ,"fromString":status
+                          ,"toString":WORKFLOW[state]})
+            status = WORKFLOW[state]
+        else:
+            field = rnd.choice(OTHER_FIELDS)
+            items.append({"field":field
+                          ,"fieldtype":"jira"
+                          ,"fromString":make_sentence(rnd, 1, 3)
+                          ,"toString":make_sentence(rnd, 1, 3)})
+        histories.append({"id":str(rnd.randrange(10**7))
+                          ,"author":make_person(rnd.randrange(spec.contributors))
+                          ,"created":jira_datetime(when)
+                          ,"items":items
+                          })
+    return histories, when
+
+
+def make_issue(rnd, spec, project, index, created):
+    """Builds a single synthetic issue
+
+    Args:
+        rnd - random.Random to draw from
+        spec - DatasetSpec
+        project - dictionary with the project's key and name
+        index - number of the issue within the project
+        created - datetime the issue was created
+
+    Returns:
+        Issue dictionary, as returned by the search API
+    """
+    pick = rnd.random()
+    if pick < spec.defect_ratio:
+        issue_type = "Bug"
+    elif pick < spec.defect_ratio + spec.story_ratio:
+        issue_type = "Story"
+    else:
+        issue_type = "Task"
+    closed = rnd.random() < spec.closed_ratio
+    histories, updated = make_histories(rnd, spec, created, closed)
+    status = CLOSED if closed else rnd.choice(WORKFLOW[:3])
+    key = "{0}-{1}".format(project['key'], index + 1)
+    return {"expand":"operations,editmeta,changelog,transitions,renderedFields"
+            ,"id":str(10000 + index)
+            ,"self":"https://jira.example.com/rest/api/2/issue/" + key
+            ,"key":key
+            ,"fields":{"project":{"key":project['key']
+                                  ,"name":project['name']}
+                       ,"issuetype":{"name":issue_type
+                                     ,"subtask":False}
+                       ,"summary":make_sentence(rnd)
+                       ,"description":make_description(
+                                        rnd
+                                        ,spec.description_lines
+                                        ,issue_type == "Story")
+                       ,"creator":make_person(rnd.randrange(spec.contributors))
+                       ,"reporter":make_person(rnd.randrange(spec.contributors))
+                       ,"assignee":make_person(rnd.randrange(spec.contributors))
+                       ,"priority":{"name":rnd.choice(["Minor"
+                                                      ,"Major"
+                                                      ,"Critical"])}
+                       ,"status":{"name":status}
+                       ,"resolutiondate":(jira_datetime(updated)
+                                          if closed else None)
+                       ,"created":jira_datetime(created)
+                       ,"updated":jira_datetime(updated)
+                       }
+            ,"changelog":{"startAt":0
+                          ,"maxResults":len(histories)
+                          ,"total":len(histories)
+                          ,"histories":histories
+                          }
+            }
+
+
+def make_sprints(rnd, spec, project_idx):
+    """Builds a project's sprints: all but the last are closed
+
+    Returns:
+        List of sprint dictionaries with id, name, state and the start
+        and end times (in milliseconds) used for the burndown chart
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    start = BASE_TIME + datetime.timedelta(days=rnd.randint(0, 14))
+    sprints = []
+    for n in range(spec.sprints):
+        end = start + datetime.timedelta(days=14)
+        sprints.append({"id":(project_idx + 1) * 1000 + n + 1
+                        ,"name":"Sprint {0}".format(n + 1)
+                        ,"state":("ACTIVE" if n == spec.sprints - 1
+                                  else "CLOSED")
+                        ,"startTime":int((start - epoch).total_seconds()*1000)
+                        ,"endTime":int((end - epoch).total_seconds()*1000)
+                        })
+        start = end
+    return sprints
+
+
+def make_dataset(spec):
+    """Builds a dataset of synthetic projects and issues
+
+    Args:
+        spec - DatasetSpec
+
+    Returns:
+        Dictionary with the 'spec' used, the 'projects' list (key, name and
+        rapid view id), the 'issues' of each project key, in order of
+        creation, and the 'sprints' of each project key
+    """
+    rnd = random.Random(spec.seed)
+    dataset = {"spec":spec._asdict()
+               ,"projects":[]
+               ,"issues":{}
+               ,"sprints":{}
+               }
+    for p in range(spec.projects):
+        key = "SYN{0}".format(p + 1) if spec.projects > 1 else "SYN"
+        project = {"key":key
+                   ,"name":"Synthetic Project {0}".format(p + 1)
+                   ,"view_id":p + 1
+                   }
+        dataset['projects'].append(project)
+        created = BASE_TIME
+        issues = []
+        for i in range(spec.issues):
+            created += datetime.timedelta(seconds=rnd.randint(60, 8*3600)
+                                          ,milliseconds=rnd.randrange(1000))
+            issues.append(make_issue(rnd, spec, project, i, created))
+        dataset['issues'][key] = issues
+        dataset['sprints'][key] = make_sprints(rnd, spec, p)
+    return dataset
+
+
+def make_search_page(issues, start_at, max_results):
+    """Wraps a slice of a project's issues as a search API result
+
+    Args:
+        issues - list of the project's issues
+        start_at - index of the first issue in the page
+        max_results - maximum number of issues in the page
+
+    Returns:
+        Search result dictionary
+    """
+    return {"expand":"schema,names"
+            ,"startAt":start_at
+            ,"maxResults":max_results
+            ,"total":len(issues)
+            ,"issues":issues[start_at:start_at + max_results]
+            }
+
+
+def save_dataset(dataset, path):
+    """Writes the dataset as JSON; gzipped if path ends with .gz"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'wt', encoding='utf-8') as out_file:
+        json.dump(dataset, out_file, separators=(',', ':'))
+
+
+def load_dataset(path):
+    """Reads a dataset written by save_dataset"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as in_file:
+        return json.load(in_file)
+
+
+def add_spec_args(parser):
+    """Adds the DatasetSpec options to an argparse parser"""
+    defaults = DatasetSpec()
+    parser.add_argument("--projects", type=int, default=defaults.projects
+                        ,help="number of projects")
+    parser.add_argument("--issues", type=int, default=defaults.issues
+                        ,help="issues per project")
+    parser.add_argument("--histories", type=float, default=defaults.histories
+                        ,help="average changelog histories per issue")
+    parser.add_argument("--description-lines", type=int
+                        ,default=defaults.description_lines
+                        ,help="average lines per description")
+    parser.add_argument("--defect-ratio", type=float
+                        ,default=defaults.defect_ratio
+                        ,help="share of the issues that are defects")
+    parser.add_argument("--story-ratio", type=float
+                        ,default=defaults.story_ratio
+                        ,help="share of the issues that are stories")
+    parser.add_argument("--closed-ratio", type=float
+                        ,default=defaults.closed_ratio
+                        ,help="share of the issues that are closed")
+    parser.add_argument("--contributors", type=int
+                        ,default=defaults.contributors
+                        ,help="number of distinct people")
+    parser.add_argument("--sprints", type=int, default=defaults.sprints
+                        ,help="sprints per project")
+    parser.add_argument("--seed", type=int, default=defaults.seed
+                        ,help="random seed")
+
+
+def spec_from_args(args):
+    """Builds a DatasetSpec from parsed add_spec_args options"""
+    return DatasetSpec(**{f: getattr(args, f) for f in DatasetSpec._fields})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic JIRA dataset")
+    parser.add_argument("dataset_file"
+                        ,help="output file (.json, or .json.gz)")
+    add_spec_args(parser)
+    args = parser.parse_args()
+    dataset = make_dataset(spec_from_args(args))
+    save_dataset(dataset, args.dataset_file)
+    total = sum(len(i) for i in dataset['issues'].values())
+    fstr = "{0}Wrote {1} issues in {2} projects to: {3}"
+    print(fstr.format(NOTE_LABEL
+                      ,total
+                      ,len(dataset['projects'])
+                      ,args.dataset_file))
@@ -8,7 +8,9 @@ Module Functions:
 
 
 Module Classes:
+-- Cassette
 -- QZUtilsExc
+-- ResponseCache
 
 Copyright 2015 Grip QA
 
@@ -34,11 +36,16 @@ __version__ = "0.01"
 import os
 import sys
 import math
+import time
+import atexit
+import hashlib
+import threading
 import urllib.error
 import urllib.parse
 import urllib.request
 import json
 import re
+import zipfile
 
 
 # String for module name
@@ -67,7 +74,279 @@ class QZUtilsExc(Exception):
         return repr(self.value)
 
 
-def restful_get(url, verbose=False):
+class ResponseCache(object):
+    """On-disk cache of GET responses, revalidated with conditional requests
+
+    Only URLs whose path ends with one of the configured endpoints are
+    cached.  Within its endpoint's TTL a cached response is served without
+    contacting the server.  After that, the next request is made with
+    If-None-Match / If-Modified-Since headers, and a 304 response is served
+    from disk.  Each response is kept as a pair of files (a small JSON
+    header and the raw body).  When the bodies exceed max_bytes, the least
+    recently used responses are evicted.
+
+    Arguments:
+    cache_dir -- String containing the directory to keep responses in
+    max_bytes -- maximum total size of the cached bodies
+    ttls -- dictionary mapping endpoints (trailing URL path components, e.g.
+            'project' or 'rapidviews/list') to TTLs in seconds
+    """
+    def __init__(self, cache_dir, max_bytes=64*1024*1024, ttls=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttls = dict(ttls or {})
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # index of hash -> [body size, last use time]
+        self._index = {}
+        self._size = 0
+        for fname in os.listdir(cache_dir):
+            base, ext = os.path.splitext(fname)
+            if ext == '.body':
+                fst = os.stat(os.path.join(cache_dir, fname))
+                self._index[base] = [fst.st_size, fst.st_mtime]
+                self._size += fst.st_size
+    # end __init__
+
+    def ttl_for(self, url):
+        """Returns the TTL for url, or None if url shouldn't be cached"""
+        path = urllib.parse.urlsplit(url).path.rstrip('/')
+        for endpoint, ttl in self.ttls.items():
+            if path.endswith('/' + endpoint.strip('/')):
+                return ttl
+        return None
+    # end ttl_for
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.meta', base + '.body'
+
+    @staticmethod
+    def make_key(url, user=None):
+        """Builds the cache key for url, as requested by user"""
+        raw = "{0}\0{1}".format(url, user or '')
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        """Returns the cached entry for key, or None
+
+        The entry is a dictionary with the 'url', 'etag', 'last_modified',
+        'content_type' and 'stored' time of the response, and its 'body'
+        """
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            if key not in self._index:
+                return None
+        try:
+            with open(meta_path, 'r') as meta_file:
+                entry = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                entry['body'] = body_file.read()
+        except (IOError, ValueError):
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+        return entry
+    # end lookup
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        """True if entry was stored or revalidated less than ttl secs ago"""
+        return (time.time() - entry['stored']) < ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Returns the revalidation headers for entry (may be empty)"""
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, url, headers, body):
+        """Stores a 200 response body, along with its validators
+
+        Arguments:
+        key -- cache key, from make_key
+        url -- String containing the requested URL
+        headers -- mapping containing the response headers
+        body -- bytes containing the response body
+        """
+        entry = {'url':url
+                 ,'etag':headers.get('ETag')
+                 ,'last_modified':headers.get('Last-Modified')
+                 ,'content_type':headers.get('Content-Type')
+                 ,'stored':time.time()
+                 }
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(body_path, 'wb') as body_file:
+                    body_file.write(body)
+                with open(meta_path, 'w') as meta_file:
+                    json.dump(entry, meta_file)
+            except IOError as ex:
+                sys.stderr.write("{0}Unable to cache response for {1}\n"
+                                 .format(_ERS, url))
+                sys.stderr.write(EXCFMTS.format(' '*len(_ERS), ex))
+                return
+            old = self._index.get(key)
+            if old is not None:
+                self._size -= old[0]
+            self._index[key] = [len(body), time.time()]
+            self._size += len(body)
+            self._evict()
+    # end store
+
+    def refresh(self, key, entry):
+        """Marks entry as revalidated by a 304 response"""
+        entry = dict(entry)
+        entry.pop('body', None)
+        entry['stored'] = time.time()
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, 'w') as meta_file:
+                    json.dump(entry, meta_file)
+            except IOError:
+                pass
+    # end refresh
+
+    def _evict(self):
+        # Drops least recently used responses until the cache fits
+        #   Note: caller must hold the lock
+        if self._size <= self.max_bytes:
+            return
+        for key, (size, used) in sorted(self._index.items()
+                                        ,key=lambda kv: kv[1][1]):
+            if self._size <= self.max_bytes:
+                break
+            for pth in self._paths(key):
+                try:
+                    os.remove(pth)
+                except OSError:
+                    pass
+            del self._index[key]
+            self._size -= size
+    # end _evict
+# end ResponseCache
+
+
+class Cassette(object):
+    """Record / replay archive of REST responses
+
+    In 'record' mode every response passed to record is appended to a zip
+    archive, one deflated member per response body, with the URL, status and
+    the content headers kept in the member's comment.  Credentials and
+    request headers are never stored.  In 'replay' mode the archive is
+    indexed when it's opened, and responses are served from it by URL,
+    without any network access: a URL requested several times gets its
+    recorded responses in the order they were recorded, and the last one
+    after that.  Bodies are read from the archive on demand, so replaying a
+    large archive doesn't hold it in memory.
+
+    A recorded archive is only complete once close has been called; it is
+    called at interpreter exit for archives that are still open.
+
+    Arguments:
+    path -- String containing the path of the archive
+    mode -- 'record' to (over)write the archive, 'replay' to read it
+    """
+    MODES = ('record', 'replay')
+    # response headers kept with each recorded body
+    HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, path, mode='replay'):
+        if mode not in self.MODES:
+            raise QZUtilsExc("Unknown cassette mode: '{0}'".format(mode))
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        # index of url -> [recorded ZipInfos, next one to replay]
+        self._index = {}
+        if mode == 'record':
+            self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self._zip = zipfile.ZipFile(path, 'r')
+            for info in self._zip.infolist():
+                url = json.loads(info.comment.decode('utf-8'))['url']
+                self._index.setdefault(url, [[], 0])[0].append(info)
+        atexit.register(self.close)
+    # end __init__
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def record(self, url, status, headers, body):
+        """Appends a response to the archive
+
+        Arguments:
+        url -- String containing the requested URL
+        status -- HTTP status code of the response
+        headers -- mapping containing the response headers
+        body -- bytes containing the response body
+        """
+        entry = {'url':url
+                 ,'status':status
+                 ,'headers':{h:headers[h] for h in self.HEADERS
+                             if headers.get(h) is not None}
+                 }
+        with self._lock:
+            if self._zip is None:
+                return
+            info = zipfile.ZipInfo("{0:08d}".format(len(self._zip.filelist))
+                                   ,time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.comment = json.dumps(entry).encode('utf-8')
+            self._zip.writestr(info, body)
+    # end record
+
+    def replay(self, url):
+        """Returns the next recorded response for url, or None
+
+        The response is a dictionary with the 'url', 'status' and 'headers'
+        of the response, and the 'info' needed by open_body / read_body
+        """
+        with self._lock:
+            recorded = self._index.get(url)
+            if recorded is None:
+                return None
+            infos, pos = recorded
+            info = infos[min(pos, len(infos) - 1)]
+            recorded[1] = pos + 1
+        entry = json.loads(info.comment.decode('utf-8'))
+        entry['info'] = info
+        return entry
+    # end replay
+
+    def open_body(self, entry):
+        """Returns a binary file object reading a replayed response's body"""
+        return self._zip.open(entry['info'])
+
+    def read_body(self, entry):
+        """Returns the body of a replayed response, as bytes"""
+        with self.open_body(entry) as body_file:
+            return body_file.read()
+
+    def close(self):
+        """Closes the archive; a recorded archive is complete after this"""
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+    # end close
+# end Cassette
+
+
+def restful_get(url, verbose=False, cache=None, cassette=None):
     """Attempt to read the REST data at the given URL. This function also
     handlesthe JSON processing
     
@@ -77,35 +356,93 @@ def restful_get(url, verbose=False):
     Arguments:
     url -- String containing the full URL for the query
     verbose -- print diagnostics, default is False
+    cache -- ResponseCache to serve / revalidate cacheable URLs, default
+             is None
+    cassette -- Cassette to record the response to, or to replay it from
+                without any network access, default is None.  The cache
+                isn't used with a cassette, so every response is recorded
     
     """
     ecd_rsp  = None
-    dcd_resp = None
+    dcd_rsp = None
     rtn_blob = None
     open_url = None
-    try:
-        open_url = urllib.request.urlopen(url)
-    except Exception as eget:
-        sys.stderr.write("{0}Unable to open specified URL: {1}\n"
-                         .format(_ERS, url))
-        sys.stderr.write(EXCFMTS.format(' '*len(_ERS), eget))
-    else:
+    encds = None
+    entry = None
+    ttl = None
+    cache_key = None
+    if cassette is not None:
+        cache = None
+    if cache is not None:
+        ttl = cache.ttl_for(url)
+        if ttl is not None:
+            cache_key = cache.make_key(url)
+            entry = cache.lookup(cache_key)
+    if entry is not None and cache.is_fresh(entry, ttl):
+        # still within the TTL, no need to ask the server
+        ecd_rsp = entry['body']
+        encds = entry['content_type']
         if verbose:
-            sys.stdout.write("{0}URL Opened\n".format(_MNS))
+            sys.stdout.write("{0}Cached Data Used\n".format(_MNS))
+    elif cassette is not None and cassette.replaying:
+        recorded = cassette.replay(url)
+        if recorded is None:
+            sys.stderr.write("{0}No recorded response for: {1}\n"
+                             .format(_ERS, url))
+        elif recorded['status'] != 200:
+            sys.stderr.write("{0}Recorded status {1} for: {2}\n"
+                             .format(_ERS, recorded['status'], url))
+        else:
+            ecd_rsp = cassette.read_body(recorded)
+            encds = recorded['headers'].get('Content-Type')
+            if verbose:
+                sys.stdout.write("{0}Recorded Data Used\n".format(_MNS))
+    else:
+        request = urllib.request.Request(
+            url, headers=ResponseCache.conditional_headers(entry))
         try:
-            ecd_rsp = open_url.read()
-        except Exception as rex:
-            sys.stderr.write("{0}Unable to read from {1}\n"
+            open_url = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as eget:
+            if eget.code == 304 and entry is not None:
+                # not modified, serve the cached copy
+                cache.refresh(cache_key, entry)
+                ecd_rsp = entry['body']
+                encds = entry['content_type']
+                if verbose:
+                    sys.stdout.write("{0}Cached Data Revalidated\n"
+                                     .format(_MNS))
+            else:
+                if cassette is not None:
+                    cassette.record(url, eget.code, eget.headers, b'')
+                sys.stderr.write("{0}Unable to open specified URL: {1}\n"
+                                 .format(_ERS, url))
+                sys.stderr.write(EXCFMTS.format(' '*len(_ERS), eget))
+        except Exception as eget:
+            sys.stderr.write("{0}Unable to open specified URL: {1}\n"
                              .format(_ERS, url))
-            sys.stderr.write(EXCFMTS.format(' '*len(_ERS), rex))
+            sys.stderr.write(EXCFMTS.format(' '*len(_ERS), eget))
         else:
             if verbose:
-                sys.stdout.write("{0}Data Read\n".format(_MNS))
-        # end read exception handler
-    # end open exception handler
-    if ((open_url is not None) and (ecd_rsp is not None)):
-        # we have a good url, and an encoded response
-        encds = open_url.info()['Content-Type']
+                sys.stdout.write("{0}URL Opened\n".format(_MNS))
+            try:
+                ecd_rsp = open_url.read()
+            except Exception as rex:
+                sys.stderr.write("{0}Unable to read from {1}\n"
+                                 .format(_ERS, url))
+                sys.stderr.write(EXCFMTS.format(' '*len(_ERS), rex))
+            else:
+                if verbose:
+                    sys.stdout.write("{0}Data Read\n".format(_MNS))
+                encds = open_url.info()['Content-Type']
+                if cache_key is not None:
+                    cache.store(cache_key, url, open_url.info(), ecd_rsp)
+                if cassette is not None:
+                    cassette.record(url, 200, open_url.info(), ecd_rsp)
+            # end read exception handler
+        # end open exception handler
+    # end cache check
+    if ecd_rsp is not None:
+        # we have an encoded response
         if encds is not None:
             # we have a content type string
             fnd = re.search('(charset=)(\S*)(;|\Z)',encds)
@@ -121,7 +458,7 @@ def restful_get(url, verbose=False):
                         sys.stdout.write("{0}Data Decoded\n".format(_MNS))
             # end fnd is not None
         # end encds is not None
-    # end open_url and ecd_rsp
+    # end ecd_rsp
     if dcd_rsp is not None:
         # we have a decoded response, let's try to run it through JSON
         try:
@@ -188,7 +525,7 @@ def validpath(pname,access=''):
 # end validpath
 
 
-def openfile(filename, mode='r'):
+def openfile(filename, mode='r', buffering=-1):
     """Attempt to open the specified file and return a handle to the file, 
     if we succeed
     
@@ -196,6 +533,7 @@ def openfile(filename, mode='r'):
     Arguments:
     filename -- String containing the pathname of the file to be opened
     mode -- mode to open the file with: 'r', 'w', 'rw'
+    buffering -- buffer size passed on to open, default is the system default
     """
     sys.stdout.write("{0}Attempting to Open file: {1}\n"
                      .format(_MNS, filename))
@@ -231,7 +569,7 @@ def openfile(filename, mode='r'):
         #   creating it, or the path exists, and we have read access to it.
         #   We'll use an exception handler to around the open, just in case.
         try:
-            retval = open(fpath,mode)
+            retval = open(fpath,mode,buffering)
         except IOError as ex:
             sys.stderr.write("{0}Access failed for file: {1}\n"
                              .format(_ERS, filename))
@@ -6,6 +6,10 @@ This script assumes that the project analysis has already been completed and
 that SonarQube has had time to store the results of the analysis in its
 database.
 
+The SonarQube server and credentials are set in the configuration file
+(sonarqube_server, sonarqube_username, sonarqube_password).  The measures
+are retrieved with the api/resources web service.
+
 Copyright 2015 Grip QA
 
 Licensed under the Apache License, Version 2.0 (the "License");
@@ -31,10 +35,12 @@ __version__ = "0.01"
 import sys
 import json
 import datetime
+import urllib.parse
 from collections import namedtuple
 
 from grip_import import GLOBALS
 from grip_import import ERR_LABEL
+from grip_import import NOTE_LABEL
 from grip_import import load_config
 from grip_import import get_rest
 from grip_import import gen_timestamp
@@ -70,7 +76,9 @@ def prep_measurement(name, sonar_rtn):
     Returns:
         The extracted value
     """
-    return make_measurement(name=name, value=get_val(sonar_rtn)
+    return make_measurement(name=name
+                            ,metadata=GLOBALS['METADATA']
+                            ,value=get_val(sonar_rtn)
                             ,timestamp=GLOBALS['TIMESTAMP'])
 
 #
@@ -116,6 +124,48 @@ def test_cases(sonar_rtn, measurements):
     measurements.append(prep_measurement("measurement.test_cases", sonar_rtn))
 
 
+# Look-up table that maps keys from the SonarQube results to the functions
+# that generate the corresponding GripMeasurements
+MEASUREMENT_LUT = {"class_complexity":class_complexity
+                   ,"complexity":complexity
+                   ,"duplicated_lines":duplicate_lines
+                   ,"file_complexity":file_complexity
+                   ,"function_complexity":function_complexity
+                   ,"lines":lines_comments
+                   ,"ncloc":loc
+                   ,"tests":test_cases
+                   }
+
+# Metrics requested from SonarQube
+SONAR_METRICS = ("lines,ncloc,duplicated_lines,complexity,class_complexity,"
+                 "function_complexity,file_complexity,tests")
+
+
+def get_resources_analysis(config, authenticate):
+    """Retrieves the project's latest analysis with the api/resources web
+    service
+
+    Args:
+        config - Fully Populated GripConfig object
+        authenticate - tuple containing the SonarQube username & password
+
+    Returns:
+        Tuple of the analysis date string and the list of results, each a
+        dictionary with the metric 'key' and its 'val'.  None if the
+        analysis couldn't be retrieved
+    """
+    url_str = ("{0}api/resources?scopes=PRJ&resource={1}"
+               "&metrics={2}&format=json")
+    url = url_str.format(config.sonarqube_server
+                         ,urllib.parse.quote(config.sonarqube_project)
+                         ,SONAR_METRICS)
+    print("Making Request for: '{0}'".format(url))
+    sonar_data = get_rest(url, authenticate)
+    if not sonar_data:
+        return None
+    return sonar_data[0]['date'], sonar_data[0].get('msr', [])
+
+
 def get_config(cfg_path):
     """Load and process the configuration file
 
@@ -146,46 +196,34 @@ def sonar_main(config):
         config - Fully Populated GripConfig object
 
     Returns:
-        No returned value
+        List of the GripMeasurements generated, or None if the analysis
+        couldn't be retrieved
     """
     global GLOBALS
-    # Hardcoded to use default local SonarQube installation
-    # You will likely need to change this for your specific situation
-    authenticate = ("admin", "admin")
-    url_str = ("http://localhost:9000/api/resources?scopes=PRJ&resource={0}"
-               "&metrics=lines,ncloc,duplicated_lines,complexity,"
-               "class_complexity,function_complexity,file_complexity,tests"
-               "&format=json")
-                                         
-    url = url_str.format(config.sonarqube_project)
-    print("Making Request for: '{0}'".format(url))
-    sonar_data = get_rest(url, authenticate)
+    authenticate = (config.sonarqube_username, config.sonarqube_password)
+    analysis = get_resources_analysis(config, authenticate)
 
-    if sonar_data is not None:
-        print("Got back {} results...".format(len(sonar_data[0]['msr'])))
-        # Define the look-up table that will map keys from the SonarQube
-        # results to functions that will generate the corresponging
-        # GripMeasurements
-        lut = {"class_complexity":class_complexity
-               ,"complexity":complexity
-               ,"duplicated_lines":duplicate_lines
-               ,"file_complexity":file_complexity
-               ,"function_complexity":function_complexity
-               ,"lines":lines_comments
-               ,"ncloc":loc
-               }
-        GLOBALS['TIMESTAMP'] = gen_timestamp(sonar_data[0]['date'])
+    if analysis is not None:
+        date_str, results = analysis
+        print("Got back {} results...".format(len(results)))
+        GLOBALS['TIMESTAMP'] = gen_timestamp(date_str)
         measurements = []
-        for v in sonar_data[0]['msr']:
-            lut[v['key']](v, measurements)
+        for v in results:
+            adapter = MEASUREMENT_LUT.get(v['key'])
+            if adapter is not None:
+                adapter(v, measurements)
+            else:
+                print("{0}Ignoring metric: '{1}'".format(NOTE_LABEL, v['key']))
 
         if measurements:
             for i in measurements:
                 print(i)
             gen_json(measurements, config.json_basename + "-sq")
+        return measurements
     else:
         err_str = "{0}Unable to retrieve issues for {1}.\n"
-        sys.stderr.write(err_str.format(ERR_LABEL, ACCOUNT_NAME))
+        sys.stderr.write(err_str.format(ERR_LABEL, GLOBALS['ACCOUNT_NAME']))
+        return None
 
 
 if __name__ == '__main__':
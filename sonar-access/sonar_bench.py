@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""sonar_bench.py benchmarks sonar_access.py against a local stand-in
+
+Starts sonar_standin.py's server in the background, with generated projects,
+and runs sonar_main once for every project, the way a scheduled import of
+each repository would.  Reports the end-to-end time, the requests per second
+served, and the time per project.  The output files are written to a
+temporary directory and discarded.
+
+USAGE:  sonar_bench.py [options]
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+from grip_import import GLOBALS
+from grip_import import ERR_LABEL
+from grip_import import GripConfig
+from grip_import import configure_transport
+
+from sonar_access import sonar_main
+import sonar_standin
+
+
+def make_bench_config(server, out_dir):
+    """Returns a configuration object for runs against the stand-in"""
+    config = GripConfig()
+    config.account_name = "bench"
+    config.sq_metadata = [{"source":"sonarqube"}, {"repo":"bench"}]
+    config.sonarqube_server = "http://127.0.0.1:{0}/".format(server.server_port)
+    config.json_basename = os.path.join(out_dir, "bench")
+    return config
+
+
+def bench_main(projects, latency, repeats, quiet=True):
+    """Runs sonar_main for every project against the stand-in
+
+    Args:
+        projects - list of project dictionaries from make_projects
+        latency - seconds the stand-in delays each response
+        repeats - number of passes over the projects; the best is reported
+        quiet - if True, sonar_main's output is suppressed
+
+    Returns:
+        True if every project produced measurements, False otherwise
+    """
+    server = sonar_standin.start_server(projects, latency)
+    standin = server.standin
+    complete = True
+    best = None
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            config = make_bench_config(server, out_dir)
+            configure_transport(config)
+            GLOBALS['ACCOUNT_NAME'] = config.account_name
+            GLOBALS['METADATA'] = config.sq_metadata
+            for _ in range(repeats):
+                standin.stats.clear()
+                measurement_cnt = 0
+                start = time.perf_counter()
+                for project in projects:
+                    config.sonarqube_project = project['key']
+                    output = io.StringIO() if quiet else sys.stdout
+                    with contextlib.redirect_stdout(output):
+                        measurements = sonar_main(config)
+                    if not measurements:
+                        complete = False
+                    else:
+                        measurement_cnt += len(measurements)
+                    for name in os.listdir(out_dir):
+                        os.remove(os.path.join(out_dir, name))
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, dict(standin.stats), measurement_cnt)
+    finally:
+        server.shutdown()
+
+    elapsed, stats, measurement_cnt = best
+    fstr = ("\nProjects:      {0} ({1:.3f}s latency)\n"
+            "End to end:    {2:.3f}s ({3:.1f} ms per project)\n"
+            "Requests:      {4} ({5:.1f}/sec)\n"
+            "Measurements:  {6} ({7:.0f}/sec)\n")
+    print(fstr.format(len(projects)
+                      ,latency
+                      ,elapsed
+                      ,1000.0 * elapsed / len(projects)
+                      ,stats.get('requests', 0)
+                      ,stats.get('requests', 0) / elapsed
+                      ,measurement_cnt
+                      ,measurement_cnt / elapsed))
+    return complete
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark sonar_access against a SonarQube stand-in")
+    sonar_standin.add_standin_args(parser)
+    parser.add_argument("--repeats", type=int, default=3
+                        ,help="passes over the projects; the best is reported")
+    parser.add_argument("--show-output", action="store_true"
+                        ,help="don't suppress sonar_access's output")
+    args = parser.parse_args()
+
+    projects = sonar_standin.make_projects(args.projects
+                                           ,args.metrics.split(",")
+                                           ,args.seed)
+    if not bench_main(projects
+                      ,args.latency
+                      ,args.repeats
+                      ,not args.show_output):
+        print("{0}Some projects produced no measurements".format(ERR_LABEL))
+        sys.exit(1)
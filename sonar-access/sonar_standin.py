@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+"""sonar_standin.py is a local stand-in for a SonarQube server
+
+Serves the api/resources web service used by sonar_access.py from generated
+projects, so it can be exercised and benchmarked without a real SonarQube.
+The resource, metrics and scopes parameters are supported; every project is
+returned when resource is omitted.
+
+The number of projects, the set of metrics each project has, and a latency
+added to every response are configurable.  Request counts are served as
+JSON at /_standin/stats.
+
+USAGE:  sonar_standin.py [options]
+
+Module External Functions:
+    make_projects - generate the projects served by the stand-in
+    make_server - create the stand-in HTTP server
+    start_server - create the server and serve it from a daemon thread
+
+Module Classes:
+    SonarStandin - routes requests to responses built from the projects
+    StandinHandler - HTTP request handler for the stand-in
+
+Copyright 2015 Grip QA
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+__author__ = "Dean Stevens"
+__copyright__ = "Copyright 2015, Grip QA"
+__license__ = "Apache License, Version 2.0"
+__status__ = "Prototype"
+__version__ = "0.01"
+
+
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from grip_import import GLOBALS
+from grip_import import NOTE_LABEL
+
+
+# Metrics every generated project has, by default: the ones requested by
+# sonar_access.py, plus one it ignores
+DEFAULT_METRICS = ["lines", "ncloc", "duplicated_lines", "complexity"
+                   ,"class_complexity", "function_complexity"
+                   ,"file_complexity", "tests", "violations"]
+
+# Metrics whose values are averages, rather than counts
+AVERAGE_METRICS = {"class_complexity", "function_complexity"
+                   ,"file_complexity"}
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def make_projects(count, metrics=None, seed=1):
+    """Generates the projects served by the stand-in
+
+    Args:
+        count - number of projects
+        metrics - list of the metric keys each project has; DEFAULT_METRICS
+                  if None
+        seed - random seed
+
+    Returns:
+        List of project dictionaries with the 'key', 'name', analysis 'date'
+        and a dictionary of metric 'values'
+    """
+    rnd = random.Random(seed)
+    metrics = DEFAULT_METRICS if metrics is None else metrics
+    start = datetime.datetime(2015, 6, 1, 10, 0, 0)
+    projects = []
+    for n in range(count):
+        lines = rnd.randint(1000, 500000)
+        values = {}
+        for metric in metrics:
+            if metric in AVERAGE_METRICS:
+                values[metric] = round(rnd.uniform(1.0, 40.0), 1)
+            elif metric == "lines":
+                values[metric] = float(lines)
+            else:
+                values[metric] = float(rnd.randint(0, lines // 2))
+        date = start + datetime.timedelta(hours=n, seconds=rnd.randrange(3600))
+        projects.append({"key":"com.example.proj{0}:proj{0}".format(n + 1)
+                         ,"name":"Project {0}".format(n + 1)
+                         ,"date":date.strftime("%Y-%m-%dT%H:%M:%S+0000")
+                         ,"values":values
+                         })
+    return projects
+
+
+class SonarStandin(object):
+    """Routes requests to responses built from the generated projects
+
+    Args:
+        projects - list of project dictionaries from make_projects
+        latency - seconds every response is delayed
+    """
+    def __init__(self, projects, latency=0.0):
+        self.latency = latency
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._projects = projects
+        self._by_key = {p['key']: p for p in projects}
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def route(self, path, query):
+        """Builds the response for a GET
+
+        Args:
+            path - string with the request path, without the leading /
+            query - dictionary of the query parameters
+
+        Returns:
+            Tuple of the status code and the body (bytes)
+        """
+        if path == "_standin/stats":
+            return 200, _encode(dict(self.stats))
+        if path == "api/resources":
+            return self.resources(query)
+        return 404, _encode({"errors":[{"msg":"Unknown url: " + path}]})
+
+    @staticmethod
+    def _metric_keys(metrics_str, project):
+        if not metrics_str:
+            return []
+        return [m for m in metrics_str.split(",") if m in project['values']]
+
+    def resources(self, query):
+        if 'resource' in query:
+            project = self._by_key.get(query['resource'])
+            if project is None:
+                return 404, _encode({"err_code":404
+                                     ,"err_msg":"Resource not found: "
+                                                + query['resource']})
+            projects = [project]
+        else:
+            projects = self._projects
+        out = []
+        for idx, project in enumerate(projects):
+            keys = self._metric_keys(query.get('metrics'), project)
+            out.append({"id":idx + 1
+                        ,"key":project['key']
+                        ,"name":project['name']
+                        ,"scope":"PRJ"
+                        ,"qualifier":"TRK"
+                        ,"date":project['date']
+                        ,"creationDate":project['date']
+                        ,"lname":project['name']
+                        ,"msr":[{"key":k
+                                 ,"val":project['values'][k]
+                                 ,"frmt_val":str(project['values'][k])}
+                                for k in keys]
+                        })
+        self.count("measures", sum(len(r['msr']) for r in out))
+        return 200, _encode(out)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """HTTP request handler for the stand-in
+
+    Speaks HTTP/1.1 with a Content-Length on every response, so clients
+    can keep their connections alive.  Nagle's algorithm is off, since the
+    headers and body are separate writes, and the client's delayed ACK
+    would otherwise hold up every response on a kept-alive connection.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if GLOBALS['VERBOSE']:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        standin = self.server.standin
+        parsed = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        standin.count("requests")
+        if standin.latency > 0:
+            time.sleep(standin.latency)
+        status, body = standin.route(parsed.path.lstrip("/"), query)
+        standin.count(status)
+        standin.count("bytes", len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(projects, latency=0.0, host="127.0.0.1", port=0):
+    """Creates the stand-in HTTP server
+
+    Args:
+        projects - list of project dictionaries from make_projects
+        latency - seconds every response is delayed
+        host - string with the address to listen on
+        port - port to listen on; 0 picks a free port
+
+    Returns:
+        ThreadingHTTPServer, with the SonarStandin as its standin attribute.
+        Its base URL is http://host:server.server_port/
+    """
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.standin = SonarStandin(projects, latency)
+    return server
+
+
+def start_server(projects, latency=0.0, host="127.0.0.1", port=0):
+    """Creates the stand-in server and serves it from a daemon thread
+
+    Returns:
+        The running server; call its shutdown method to stop it
+    """
+    server = make_server(projects, latency, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def add_standin_args(parser):
+    """Adds the stand-in options to an argparse parser"""
+    parser.add_argument("--projects", type=int, default=10
+                        ,help="number of projects")
+    parser.add_argument("--metrics", default=",".join(DEFAULT_METRICS)
+                        ,help="comma separated metrics every project has")
+    parser.add_argument("--latency", type=float, default=0.0
+                        ,help="seconds each response is delayed")
+    parser.add_argument("--seed", type=int, default=1
+                        ,help="random seed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve generated SonarQube projects")
+    add_standin_args(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    projects = make_projects(args.projects, args.metrics.split(","), args.seed)
+    server = make_server(projects, args.latency, args.host, args.port)
+    print("{0}Serving {1} projects at http://{2}:{3}/".format(
+        NOTE_LABEL, len(projects), args.host, server.server_port))
+    print("{0}First project: {1}".format(NOTE_LABEL, projects[0]['key']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\n{0}Requests served: {1}".format(
+            NOTE_LABEL, dict(server.standin.stats)))